@@ -20,11 +20,10 @@ COLORS = np.array([
 DIRECTIONS = np.array(["SE", "SW", "W", "NW", "NE", "E"])
 TESTING = 0
 
-root = Tk()
-root.withdraw()
-size = (int(root.winfo_screenheight() * .9), int(root.winfo_screenheight() * .9))
-root.destroy()
-scale = size[0] / 1000
+# The window size depends on the screen, so it is only set once the
+# program is started, and importing this module needs no display.
+size = (1000, 1000)
+scale = 1
 
 def make_hex_surface(color, radius, border_color=(100, 100, 100), border=True, hollow=False):
     """
@@ -309,12 +308,7 @@ class VisualHexMap:
                         else:
                             pass
 
-                        found = False
-                        for moved in self.board.moved_pieces:
-                            if np.array_equal(moved, self.axial_clicked[0]):
-                                found = True
-                                break
-                        if found:
+                        if self.board.index_of(self.axial_clicked[0]) in self.board.moved_pieces:
                             continue
                         if (np.array_equal(self.valid_moves, None)) and axial_player == self.board.player:
                             self.clicked_hex = self.axial_clicked
@@ -365,12 +359,7 @@ class VisualHexMap:
                     else:
                         pass
 
-                    found = False
-                    for fired in self.board.fired_pieces:
-                        if np.array_equal(fired, self.axial_clicked[0]):
-                            found = True
-                            break
-                    if found:
+                    if self.board.index_of(self.axial_clicked[0]) in self.board.fired_pieces:
                         continue
 
                     if (np.array_equal(self.valid_moves, None)) and axial_player == self.board.player:
@@ -468,13 +457,13 @@ class VisualHexMap:
         #self.test_surf.fill(COLORS[-1])
 
         # Draw pieces that have already moved.
-        if not np.array_equal(self.board.moved_pieces, []):
-            moved_hexes = self.hex_map[np.array(self.board.moved_pieces)]
+        if self.board.moved_pieces:
+            moved_hexes = self.hex_map[self.board.axial_coords[list(self.board.moved_pieces)]]
             list(map(self.draw_moved, moved_hexes))
 
         # Draw pieces that have already attacked.
-        if not np.array_equal(self.board.fired_pieces, []):
-            attacked_hexes = self.hex_map[np.array(self.board.fired_pieces)]
+        if self.board.fired_pieces:
+            attacked_hexes = self.hex_map[self.board.axial_coords[list(self.board.fired_pieces)]]
             list(map(self.draw_attack, attacked_hexes))
 
         # Draw pieces
@@ -582,6 +571,8 @@ if __name__ == '__main__':
 
     root = Tk()
     root.withdraw()
+    size = (int(root.winfo_screenheight() * .9), int(root.winfo_screenheight() * .9))
+    scale = size[0] / 1000
     dirname = filedialog.askopenfilename(initialdir = "settings/", title = "Select config file to use")
     root.destroy()
     visual_hex_map = VisualHexMap(dirname)
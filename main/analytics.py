@@ -0,0 +1,154 @@
+import argparse
+import csv
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from log_parser import LogParser
+
+# Columns of the per-game table made by analyze. Games with more than two
+# players add a "player N damage dealt" column for each of the others.
+GAME_COLUMNS = ["log", "turns", "winner", "player 1 damage dealt", "player 2 damage dealt"]
+TEMPLATE_COLUMNS = ["template", "pieces", "survivors", "survival rate", "damage taken"]
+
+def template_health(turn, n_templates):
+    '''
+    :return: the total health of the pieces of each template.
+    '''
+    return np.bincount(turn["template"], weights = turn["health"], minlength = n_templates).astype(np.int64)
+
+def game_stats(location):
+    '''
+    Reads one log and measures the game in it. Damage is found from
+    the health lost between turns: pieces only lose health on their
+    opponent's turn, so the health a player loses in a turn is the
+    damage dealt by the player whose turn it was. Logs do not list the
+    players, so they are taken to be the owners in the first turn.
+    :return: dictionary of the game's length, winner, an array of the damage
+             dealt by each player, and the pieces, survivors and damage taken of each
+             template, or None if the log has no turns.
+    '''
+    parser = LogParser(location)
+    n_templates = len(parser.templates)
+
+    first = last = None
+    damage_taken = np.zeros(n_templates, dtype = np.int64)
+    turns = -1
+    for turn in parser:
+        turns += 1
+        if first is None:
+            first = last = turn
+            n_players = max(2, int(turn["owner"].max(initial = 0)))
+            damage_dealt = np.zeros(n_players + 1, dtype = np.int64)
+            continue
+
+        # Players take turns in order, starting with player 1.
+        player = (turns - 1) % n_players + 1
+        for owner in range(1, n_players + 1):
+            before = template_health(last[last["owner"] == owner], n_templates)
+            after = template_health(turn[turn["owner"] == owner], n_templates)
+            lost = np.maximum(before - after, 0)
+            damage_taken += lost
+            if owner != player:
+                damage_dealt[player] += lost.sum()
+        last = turn
+
+    if first is None:
+        return None
+
+    owners = np.unique(last["owner"])
+    return {
+        "log": os.path.basename(location),
+        "turns": turns,
+        "winner": int(owners[0]) if len(owners) == 1 else 0,
+        "damage dealt": damage_dealt[1:],
+        "pieces": np.bincount(first["template"], minlength = n_templates),
+        "survivors": np.bincount(last["template"], minlength = n_templates),
+        "damage taken": damage_taken,
+    }
+
+def log_files(directory):
+    '''
+    :return: generator of the text logs in a directory, found without listing it all at once.
+    '''
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".txt") and entry.is_file():
+                yield entry.path
+
+def analyze(directory, workers = None, chunksize = 64):
+    '''
+    Measures every log in a directory across a pool of processes.
+    :return: the per-game table, as a dictionary of GAME_COLUMNS
+             arrays, and the per-template table, as a dictionary of
+             TEMPLATE_COLUMNS arrays with one row per template number.
+    '''
+    games = {column: [] for column in GAME_COLUMNS}
+    pieces = np.zeros(0, dtype = np.int64)
+    survivors = np.zeros(0, dtype = np.int64)
+    damage_taken = np.zeros(0, dtype = np.int64)
+
+    with Pool(workers) as pool:
+        for stats in pool.imap_unordered(game_stats, log_files(directory), chunksize = chunksize):
+            if stats is None:
+                continue
+
+            row = len(games["log"])
+            games["log"].append(stats["log"])
+            games["turns"].append(stats["turns"])
+            games["winner"].append(stats["winner"])
+            for player, dealt in enumerate(stats["damage dealt"], 1):
+                games.setdefault("player {} damage dealt".format(player), [0] * row).append(dealt)
+            for values in games.values():
+                if len(values) == row:
+                    values.append(0)
+
+            size = max(len(pieces), len(stats["pieces"]))
+            pieces = np.pad(pieces, (0, size - len(pieces)))
+            survivors = np.pad(survivors, (0, size - len(survivors)))
+            damage_taken = np.pad(damage_taken, (0, size - len(damage_taken)))
+            pieces[:len(stats["pieces"])] += stats["pieces"]
+            survivors[:len(stats["survivors"])] += stats["survivors"]
+            damage_taken[:len(stats["damage taken"])] += stats["damage taken"]
+
+    games = {column: np.array(values) for column, values in games.items()}
+    templates = {
+        "template": np.arange(1, len(pieces)),
+        "pieces": pieces[1:],
+        "survivors": survivors[1:],
+        "survival rate": survivors[1:] / np.maximum(pieces[1:], 1),
+        "damage taken": damage_taken[1:],
+    }
+    return games, templates
+
+def write_csv(table, location):
+    with open(location, "w", newline = "") as file:
+        writer = csv.writer(file)
+        writer.writerow(list(table))
+        writer.writerows(zip(*table.values()))
+
+def write_columns(table, location):
+    '''
+    Writes a table as a .npz file with one array per column.
+    '''
+    np.savez(location, **table)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Measure every game log in a directory.")
+    parser.add_argument("logs", nargs = "?", default = "logs")
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--output", default = "analytics", help = "prefix of the output files")
+    parser.add_argument("--format", choices = ["csv", "npz"], default = "csv")
+    args = parser.parse_args()
+
+    games, templates = analyze(args.logs, args.workers)
+    write = write_csv if args.format == "csv" else write_columns
+    write(games, args.output + "-games." + args.format)
+    write(templates, args.output + "-templates." + args.format)
+
+    print("games: {}".format(len(games["turns"])))
+    if len(games["turns"]):
+        print("mean turns: {}".format(float(np.mean(games["turns"]))))
+    for row in zip(*templates.values()):
+        print("template {}: {} pieces, survival rate {:.3f}, damage taken {}".format(row[0], row[1], row[3], row[4]))
@@ -0,0 +1,191 @@
+import numpy as np
+
+from game_board import ANGLE_COSTS, attack_offset_costs
+from piece import EMPTY
+
+# Cost given to states the movement search has not reached.
+UNREACHED = np.iinfo(np.int16).max
+
+class BatchEngine:
+    '''
+    Plays many games of the same scenario in lockstep. Every game
+    starts from the pieces of a loaded GameBoard, and the pieces
+    of all games are held as stacked arrays, health[game, piece],
+    tile[game, piece] and facing[game, piece], so moves, attacks
+    and turn ends are applied to every game at once.
+
+    Pieces are numbered by their slot in the board's PieceStore.
+    The rules are GameBoard's, except that a piece that has moved
+    cannot move or turn again in the same turn.
+    '''
+    def __init__(self, board, n_games, rng = None):
+        pieces = board.pieces
+        count = pieces.count
+        self.n_games = n_games
+        self.rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+        self.axial_coords = board.axial_coords
+        self.neighbors = board.neighbors
+        self.n_tiles = len(board.axial_coords)
+
+        # Owners and templates are the same in every game.
+        self.owner = pieces.owner[:count].copy()
+        self.movement_d = pieces.template_stats[pieces.template[:count], 1]
+        self.attack_d = pieces.template_stats[pieces.template[:count], 2]
+        self.power = pieces.template_stats[pieces.template[:count], 3]
+
+        self.health = np.tile(pieces.health[:count], (n_games, 1))
+        self.tile = np.tile(pieces.tile[:count], (n_games, 1))
+        self.facing = np.tile(pieces.facing[:count].astype(np.int64), (n_games, 1))
+        self.tile_slots = np.tile(pieces.tile_slots, (n_games, 1))
+
+        self.moved = np.zeros((n_games, count), dtype = bool)
+        self.fired = np.zeros((n_games, count), dtype = bool)
+
+        self.player = board.player
+        self.n_players = board.n_players
+        self.winner = np.zeros(n_games, dtype = np.int64)
+        self.turns = np.zeros(n_games, dtype = np.int64)
+
+    def active(self):
+        '''
+        :return: mask of the games that nobody has won yet.
+        '''
+        return self.winner == 0
+
+    def reachable(self, games, pieces):
+        '''
+        Runs the movement search for one piece in each of the given games.
+        The search is done one cost at a time for all the games together.
+        :param games: array of k game numbers.
+        :param pieces: array of k piece numbers.
+        :return: kxn_tilesx6 array of the cost to reach each (tile, facing)
+                 state, with UNREACHED for states out of range.
+        '''
+        k = len(games)
+        dist = self.movement_d[pieces]
+        rows = np.arange(k)
+        free = self.tile_slots[games] == EMPTY
+
+        best = np.full((k, self.n_tiles, 6), UNREACHED, dtype = np.int16)
+        best[rows, self.tile[games, pieces], self.facing[games, pieces]] = 0
+
+        for cost in range(int(dist.max(initial = 0)) + 1):
+            at_cost = best == cost
+
+            # Turn in place, with the cost of the turn from ANGLE_COSTS.
+            for facing in range(6):
+                turning = at_cost[:, :, facing]
+                for direction in range(6):
+                    if direction != facing:
+                        turned = np.where(turning, cost + ANGLE_COSTS[facing, direction], UNREACHED)
+                        np.minimum(best[:, :, direction], turned, out = best[:, :, direction])
+
+            # Step forward onto a free neighbor, for pieces with movement left.
+            stepping = at_cost & (cost + 1 <= dist)[:, None, None]
+            for facing in range(6):
+                row, source = np.nonzero(stepping[:, :, facing])
+                target = self.neighbors[source, facing]
+                keep = target != -1
+                row, target = row[keep], target[keep]
+                keep = free[row, target]
+                row, target = row[keep], target[keep]
+                best[row, target, facing] = np.minimum(best[row, target, facing], cost + 1)
+
+        best[best > dist[:, None, None]] = UNREACHED
+        return best
+
+    def move(self, pieces, tiles, facings):
+        '''
+        Moves one piece in every game, checking each move is allowed.
+        Moving a piece to its own tile turns it in place.
+        :param pieces: array with the piece to move in each game, or -1 for no move.
+        :param tiles: array with the tile index to move to in each game.
+        :param facings: array with the new direction code in each game.
+        :return: mask of the games where the move was made.
+        '''
+        pieces = np.asarray(pieces)
+        tiles = np.asarray(tiles)
+        games = np.arange(self.n_games)
+        safe_pieces = np.maximum(pieces, 0)
+        current = self.tile[games, safe_pieces]
+
+        allowed = (self.active() & (pieces >= 0)
+                   & (self.owner[safe_pieces] == self.player)
+                   & (current != EMPTY)
+                   & ~self.moved[games, safe_pieces])
+        allowed &= (tiles == current) | (self.tile_slots[games, tiles] == EMPTY)
+
+        check = np.flatnonzero(allowed & (tiles != current))
+        if len(check):
+            best = self.reachable(check, pieces[check])
+            allowed[check] = best[np.arange(len(check)), tiles[check]].min(axis = 1) != UNREACHED
+
+        games = np.flatnonzero(allowed)
+        pieces, tiles = pieces[games], tiles[games]
+        self.tile_slots[games, self.tile[games, pieces]] = EMPTY
+        self.tile_slots[games, tiles] = pieces
+        self.tile[games, pieces] = tiles
+        self.facing[games, pieces] = np.asarray(facings)[games]
+        self.moved[games, pieces] = True
+        return allowed
+
+    def attack(self, attackers, targets):
+        '''
+        Makes one attack in every game, checking each attack is allowed.
+        Damage is power / (1 + ln(cost)) * N(1, 0.2), floored, with the
+        random factors for all the games drawn at once.
+        :param attackers: array with the attacking piece in each game, or -1 for no attack.
+        :param targets: array with the piece attacked in each game.
+        :return: array of the damage done in each game, with -1 where no attack was made.
+        '''
+        attackers = np.asarray(attackers)
+        targets = np.asarray(targets)
+        games = np.arange(self.n_games)
+        safe_attackers = np.maximum(attackers, 0)
+        safe_targets = np.maximum(targets, 0)
+        attacker_tiles = self.tile[games, safe_attackers]
+        target_tiles = self.tile[games, safe_targets]
+
+        allowed = (self.active() & (attackers >= 0) & (targets >= 0)
+                   & (self.owner[safe_attackers] == self.player)
+                   & (self.owner[safe_targets] != self.player)
+                   & (attacker_tiles != EMPTY) & (target_tiles != EMPTY)
+                   & ~self.fired[games, safe_attackers])
+
+        delta = self.axial_coords[target_tiles] - self.axial_coords[attacker_tiles]
+        costs = attack_offset_costs(delta, self.facing[games, safe_attackers])
+        allowed &= costs <= self.attack_d[safe_attackers]
+
+        rolls = np.maximum(0, self.rng.normal(1, 0.2, self.n_games))
+        damage = np.floor(self.power[safe_attackers] / (1 + np.log(np.maximum(costs, 1))) * rolls).astype(np.int64)
+        damage = np.where(allowed, damage, -1)
+
+        games = np.flatnonzero(allowed)
+        self.health[games, targets[games]] -= damage[games].astype(self.health.dtype)
+        self.fired[games, attackers[games]] = True
+
+        dead = games[self.health[games, targets[games]] <= 0]
+        self.tile_slots[dead, self.tile[dead, targets[dead]]] = EMPTY
+        self.tile[dead, targets[dead]] = EMPTY
+        return damage
+
+    def end_turn(self):
+        '''
+        Ends the turn in every game, changes the current player, and
+        checks which games have been won.
+        :return: array of the winner of each game, with 0 for games still going.
+        '''
+        active = self.active()
+        self.turns[active] += 1
+        self.moved[:] = False
+        self.fired[:] = False
+        self.player = self.player % self.n_players + 1
+
+        # A game is won when only one player has pieces left, as in GameBoard.end_turn.
+        on_board = self.tile != EMPTY
+        players_left = np.stack([(on_board & (self.owner == player)).any(axis = 1)
+                                 for player in range(1, self.n_players + 1)], axis = 1)
+        won = active & (players_left.sum(axis = 1) == 1)
+        self.winner[won] = players_left[won].argmax(axis = 1) + 1
+        return self.winner
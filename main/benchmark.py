@@ -0,0 +1,159 @@
+import sys
+import timeit
+from queue import Queue
+
+import numpy as np
+import hexy as hx
+
+import game_board as hxgame
+from game_board import v2_angle
+
+# The Queue based searches that GameBoard used before the neighbor table
+# and search buffers, kept here as the baseline for the benchmark.
+
+def queue_valid_moves(board, hex):
+    dist = hex.piece.movement_d
+    center = hex.get_axial_coords()
+    moves = []
+    frontier = Queue()
+    Directions = np.array(["NW", "NE", "SE", "SW", "E", "W"])
+    vectors = dict(zip(hxgame.DIRECTIONS, hxgame.DIRECTION_VECTORS))
+
+    frontier.put(np.array([center[0], center[1], 0, hex.piece.direction], dtype = object))
+
+    while not frontier.empty():
+        current = frontier.get()
+        r, q, cost, direction = current
+
+        found = False
+        for i in moves[::-1]:
+            if np.array_equal(current[0:2], i[0:2]) and current[3] == i[3]:
+                if current[2] >= i[2]:
+                    found = True
+                    break
+        if found:
+            continue
+
+        for dir in Directions:
+            move_cost = cost + v2_angle(vectors[direction], vectors[dir])
+            if move_cost <= dist:
+                moves.append(np.array([r, q, move_cost, dir], dtype = object))
+
+                neighbor = (hx.axial_to_cube(np.array([current[0:2]])) + vectors[dir])[0]
+                if move_cost + 1 <= dist:
+                    neighbor_move = np.array([neighbor[0], neighbor[2], move_cost + 1, dir], dtype = object)
+                    if (np.array_equal(board[neighbor_move[0:2]], []) or board[neighbor_move[0:2]][0].piece.player != 0):
+                        continue
+                    frontier.put(neighbor_move)
+
+    return np.array(moves, dtype = object)
+
+def queue_valid_attacks(board, hex):
+    center = hex.get_axial_coords()
+    center_direction = hxgame.DIRECTION_VECTORS[hxgame.DIRECTION_CODES[hex.piece.direction]]
+    center_start = np.array([center[0], center[1], 0])
+    moves = np.array([center_start])
+
+    frontier = Queue()
+    frontier.put(center_start)
+
+    while not frontier.empty():
+        current = frontier.get()
+        cube_current = hx.axial_to_cube(np.array([current[0:2]]))
+
+        for direction in hxgame.ATTACK_VECTORS:
+            next_nb = hx.get_neighbor(cube_current, direction)
+            found = False
+            for i in moves[::-1]:
+                if np.array_equal(next_nb[0][::2], i[0:2]):
+                    found = True
+                    break
+
+            if found:
+                continue
+
+            cost = current[2] + 1 + v2_angle(center_direction, direction)
+            if cost <= hex.piece.attack_d:
+                new_move = np.array([next_nb[0][0], next_nb[0][2], cost])
+                moves = np.vstack([moves, new_move])
+                frontier.put(new_move)
+
+    return moves
+
+def move_mismatches(board, tiles):
+    '''
+    Returns the tiles whose movement search finds different states than
+    the Queue based search, comparing the cheapest cost of every
+    (q, r, facing) state each of them reaches.
+    '''
+    mismatches = []
+    for tile in tiles:
+        queued = {}
+        for q, r, cost, facing in queue_valid_moves(board, tile).tolist():
+            key = (int(q), int(r), facing)
+            queued[key] = min(cost, queued.get(key, cost))
+
+        states, costs = board.search_moves(tile.index,
+                                           hxgame.DIRECTION_CODES[tile.piece.direction],
+                                           tile.piece.movement_d)
+        index, facing = np.divmod(states, 6)
+        searched = {(q, r, hxgame.DIRECTIONS[code]): cost
+                    for (q, r), code, cost in zip(board.axial_coords[index].tolist(), facing.tolist(), costs.tolist())}
+        if searched != queued:
+            mismatches.append(tile)
+    return mismatches
+
+def attack_mismatches(board, tiles):
+    '''
+    Returns the tiles whose vectorized attack range differs from
+    the search's, comparing only tiles that are on the board.
+    '''
+    mismatches = []
+    for tile in tiles:
+        searched = {tuple(move) for move in board.get_valid_attacks_bfs(tile).tolist()
+                    if board.index_of(move[0:2]) != -1}
+        vectorized = {tuple(move) for move in board.get_valid_attacks_vectorized(tile).tolist()}
+        if searched != vectorized:
+            mismatches.append(tile)
+    return mismatches
+
+def searched_valid_moves(board, hex):
+    '''
+    get_valid_moves with the reachability cache emptied first,
+    so every call runs the search.
+    '''
+    board.reach_cache.clear()
+    return board.get_valid_moves(hex)
+
+def time_search(search, board, tiles, repeats):
+    '''
+    Returns the average time, in milliseconds, for one
+    call of search on each of the given tiles.
+    '''
+    total = timeit.timeit(lambda: [search(board, tile) for tile in tiles], number = repeats)
+    return 1000 * total / (repeats * len(tiles))
+
+def run(file_name = 'settings/default_settings.yaml', repeats = 5):
+    board = hxgame.GameBoard(file_name, log = False)
+    tiles = [tile for tile in board.game_hexes if tile.piece.player != 0]
+
+    searches = [("get_valid_moves", queue_valid_moves, searched_valid_moves),
+                ("  (cached)", queue_valid_moves, hxgame.GameBoard.get_valid_moves),
+                ("get_valid_attacks", queue_valid_attacks, hxgame.GameBoard.get_valid_attacks_bfs),
+                ("  (vectorized)", queue_valid_attacks, hxgame.GameBoard.get_valid_attacks_vectorized)]
+
+    print(len(board.game_hexes), "tiles,", len(tiles), "pieces,", repeats, "repeats")
+    for name, before, after in searches:
+        before_ms = time_search(before, board, tiles, repeats)
+        after_ms = time_search(after, board, tiles, repeats)
+        print("{:<18} before {:9.3f} ms  after {:9.3f} ms  speedup {:6.1f}x".format(
+            name, before_ms, after_ms, before_ms / after_ms))
+
+    print("move search mismatches:", len(move_mismatches(board, tiles)))
+    print("vectorized attack mismatches:", len(attack_mismatches(board, tiles)))
+    print("reachability cache hits:", board.reach_cache.hits, "misses:", board.reach_cache.misses)
+
+if __name__ == '__main__':
+    file_name = sys.argv[1] if len(sys.argv) > 1 else 'settings/default_settings.yaml'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run(file_name, repeats)
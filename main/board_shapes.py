@@ -0,0 +1,117 @@
+import numpy as np
+import hexy as hx
+
+SE = np.array((0, -1, 1))
+SW = np.array((-1, 0, 1))
+W = np.array((-1, 1, 0))
+NW = np.array((0, 1, -1))
+NE = np.array((1, 0, -1))
+E = np.array((1, -1, 0))
+
+# Vectors of the directions in the order of piece.DIRECTIONS, so the
+# column of a direction in the neighbor table is its facing code.
+DIRECTION_VECTORS = np.array([SE, SW, W, NW, NE, E])
+
+def pack_coords(axial):
+    '''
+    Packs an array of axial coordinates into single 64 bit
+    integers, so coordinates can be sorted and searched as keys.
+    :param axial: nx2 array of axial coordinates.
+    '''
+    axial = np.asarray(axial, dtype = np.int64).reshape(-1, 2)
+    return (axial[:, 0] << 32) + axial[:, 1]
+
+def build_neighbor_table(axial_coords):
+    '''
+    Builds the neighbor table for a board. Row i holds the tile
+    indices of the six neighbors of tile i, in DIRECTIONS order,
+    with -1 for neighbors that are not on the board.
+    :param axial_coords: nx2 array of the board's axial coordinates.
+    '''
+    keys = pack_coords(axial_coords)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    offsets = hx.cube_to_axial(DIRECTION_VECTORS)
+    neighbor_keys = pack_coords((axial_coords[:, None, :] + offsets[None, :, :]).reshape(-1, 2))
+
+    found = np.searchsorted(sorted_keys, neighbor_keys)
+    found[found == len(sorted_keys)] = 0
+    neighbors = np.where(sorted_keys[found] == neighbor_keys, order[found], -1)
+
+    return neighbors.reshape(-1, 6).astype(np.int32)
+
+# Shapes a settings file can give for its board, named as in config_creator.
+SHAPES = ["rectangle", "hexagon", "triangle", "rhombus"]
+
+def rectangle(size):
+    '''
+    :return: axial coordinates of a rectangle of 2 * size + 1 rows of 2 * size tiles.
+    '''
+    r = np.repeat(np.arange(-size, size + 1), 2 * size)
+    q = np.tile(np.arange(-size, size), 2 * size + 1) - (r >> 1)
+    return np.column_stack([q, r])
+
+def hexagon(size):
+    '''
+    :return: axial coordinates of a hexagon of radius size, in rings
+             spiraling out from the center as hexy.get_spiral gives them.
+    '''
+    radius = np.repeat(np.arange(1, size + 1), 6 * np.arange(1, size + 1))
+    position = np.arange(len(radius)) - 3 * radius * (radius - 1)
+    side = position // radius
+    step = position % radius
+
+    directions = hx.ALL_DIRECTIONS.astype(np.int64)
+    cube = (directions[side - 1] * (radius - step)[:, None]
+            + directions[side] * step[:, None])
+    cube = np.concatenate([np.zeros((1, 3), dtype = np.int64), cube])
+    return hx.cube_to_axial(cube).astype(np.int64)
+
+def triangle(size):
+    '''
+    :return: axial coordinates of a triangle with sides of size + 1 tiles.
+    '''
+    q, r = np.nonzero(np.add.outer(np.arange(size + 1), np.arange(size + 1)) <= size)
+    return np.column_stack([q, r])
+
+def rhombus(size):
+    '''
+    :return: axial coordinates of a parallelogram size + 1 tiles wide
+             and 2 * size + 1 tiles high.
+    '''
+    q, r = np.meshgrid(np.arange(int(-size / 2), int(size / 2) + 1), np.arange(-size, size + 1), indexing = "ij")
+    return np.column_stack([q.ravel(), r.ravel()])
+
+SHAPE_FUNCTIONS = dict(zip(SHAPES, [rectangle, hexagon, triangle, rhombus]))
+
+def board_coords(board):
+    '''
+    Makes the tiles of the board section of a settings file. The
+    section is either a list of tile coordinates, or a shape and
+    size, with optional lists of tiles to add and to remove:
+        board:
+          shape: hexagon
+          size: 10
+          add: [[11, 0]]
+          remove: [[0, 0]]
+    The shapes are the same as config_creator's.
+    :return: nx2 array of axial coordinates.
+    '''
+    if not isinstance(board, dict):
+        return np.array(board, dtype = np.int64).reshape(-1, 2)
+
+    if board['shape'] not in SHAPE_FUNCTIONS:
+        raise ValueError("Unknown board shape: " + str(board['shape']))
+    coords = SHAPE_FUNCTIONS[board['shape']](int(board['size']))
+
+    add = np.array(board.get('add', []), dtype = np.int64).reshape(-1, 2)
+    if len(add):
+        add = add[np.sort(np.unique(pack_coords(add), return_index = True)[1])]
+        coords = np.concatenate([coords, add[~np.isin(pack_coords(add), pack_coords(coords))]])
+
+    remove = np.array(board.get('remove', []), dtype = np.int64).reshape(-1, 2)
+    if len(remove):
+        coords = coords[~np.isin(pack_coords(coords), pack_coords(remove))]
+
+    return coords
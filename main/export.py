@@ -1,45 +1,96 @@
 from datetime import datetime
+from piece import DIRECTIONS
 
-def init_log(game):
-    day = datetime.now()
-    location = "logs/" + day.strftime("%d_%m_%Y-%H_%M_%S") + ".txt"
-    file = open(location, "x")
-    
+def header_text(game):
+    '''
+    :return: the start of a game's log: the templates and the
+             board tiles, each followed by a "-" line.
+    '''
+    lines = []
     for x in range(1, len(game.templates)):
         template = game.templates[x]
         info_list = [str(template.health), str(template.movement_d), str(template.attack_d), str(template.power)]
-        info = " ".join(info_list) + "\n"
-        file.write(info)
-    file.write("-\n")
+        lines.append(" ".join(info_list) + "\n")
+    lines.append("-\n")
 
     for ignore, tile in game.items():
-        file.write(str(tile.axial_coordinates[0]) + " " + str(tile.axial_coordinates[1]) + "\n")
-    file.write("-\n")
+        lines.append(str(tile.axial_coordinates[0]) + " " + str(tile.axial_coordinates[1]) + "\n")
+    lines.append("-\n")
+    return "".join(lines)
+
+def turn_text(game):
+    '''
+    :return: the log lines for the pieces on the board, ordered
+             by player and then by tile, followed by a "-" line.
+    '''
+    pieces = game.pieces
+
+    # One pass over the pieces on the board, sorted by owner and then tile.
+    alive = pieces.ordered_slots()
+    coords = game.axial_coords[pieces.tile[alive]]
+
+    lines = [" ".join([str(pieces.owner[slot]),
+                       str(pieces.template[slot]),
+                       str(coords[x, 0]),
+                       str(coords[x, 1]),
+                       str(DIRECTIONS[pieces.facing[slot]]),
+                       str(pieces.health[slot])]) + "\n"
+             for x, slot in enumerate(alive)]
+    lines.append("-\n")
+    return "".join(lines)
+
+def log_location(extension = ".txt"):
+    '''
+    :return: a timestamped file name in the logs folder.
+    '''
+    day = datetime.now()
+    return "logs/" + day.strftime("%d_%m_%Y-%H_%M_%S") + extension
+
+class LogWriter:
+    '''
+    Writes the log of a game through a single open handle,
+    which can be a file or an in-memory stream such as
+    io.StringIO. The handle is flushed every flush_interval
+    turns, and when the writer is flushed or closed.
+    '''
+    def __init__(self, handle, flush_interval = 1, location = None):
+        self.handle = handle
+        self.flush_interval = flush_interval
+        self.location = location
+        self.turns = 0
+
+    @classmethod
+    def to_file(cls, location = None, flush_interval = 1):
+        '''
+        Opens a new log file, with a timestamped name in the logs folder by default.
+        '''
+        location = location or log_location()
+        return cls(open(location, "x"), flush_interval, location)
+
+    def write_header(self, game):
+        self.handle.write(header_text(game))
+
+    def write_turn(self, game):
+        self.handle.write(turn_text(game))
+        self.turns += 1
+        if self.flush_interval and self.turns % self.flush_interval == 0:
+            self.flush()
+
+    def flush(self):
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+def init_log(game):
+    location = log_location()
+    file = open(location, "x")
+    file.write(header_text(game))
     file.close()
 
     return location
 
 def parse_turn(game, file):
     f = open(file, "a")
-    for ignore, tile in game.items():
-        if tile.piece.player == 1:
-            info_list = [str(tile.piece.player), 
-                        str(tile.piece.p_type), 
-                        str(tile.axial_coordinates[0]), 
-                        str(tile.axial_coordinates[1]), 
-                        str(tile.piece.direction), 
-                        str(tile.piece.health)]
-            f.write(" ".join(info_list) + "\n")
-
-    for ignore, tile in game.items():
-        if tile.piece.player == 2:
-            info_list = [str(tile.piece.player), 
-                        str(tile.piece.p_type), 
-                        str(tile.axial_coordinates[0]), 
-                        str(tile.axial_coordinates[1]), 
-                        str(tile.piece.direction), 
-                        str(tile.piece.health)]
-            f.write(" ".join(info_list) + "\n")
-
-    f.write("-\n")
-    f.close()
\ No newline at end of file
+    f.write(turn_text(game))
+    f.close()
@@ -1,17 +1,23 @@
 import numpy as np
 import hexy as hx
-from piece import Piece, PieceTemplate, EmptyTemplate, EmptyPiece
-import yaml
+from hexy.hex_map import make_key_from_coordinates
+from piece import Piece, PieceTemplate, EmptyTemplate, EmptyPiece, PieceStore, PieceView, DIRECTIONS, DIRECTION_CODES, EMPTY
+from board_shapes import DIRECTION_VECTORS, pack_coords
 import export
-from queue import Queue
+from search import SearchBuffers, ReachabilityCache
+from rolls import DamageRolls
+from scenario import load_scenario, CACHE_DIR
+from zobrist import ZobristKeys
 from os import path
 
-SE = np.array((0, -1, 1))
-SW = np.array((-1, 0, 1))
-W = np.array((-1, 1, 0))
-NW = np.array((0, 1, -1))
-NE = np.array((1, 0, -1))
-E = np.array((1, -1, 0))
+# Kinds of action accepted by GameBoard.apply. Simulation.step takes MOVE and
+# ATTACK actions only, as it always ends the turn itself.
+MOVE = "move"
+ATTACK = "attack"
+END_TURN = "end turn"
+
+# Neighbor offsets used by the attack search, in the order it visits them.
+ATTACK_VECTORS = np.array([hx.NW, hx.NE, hx.SE, hx.SW, hx.E, hx.W])
 
 def v2_angle(vector1, vector2):
     '''
@@ -37,15 +43,68 @@ def v2_angle(vector1, vector2):
         print(vector1, vector2)
         return int(0.954929658551372 * np.arccos(val))
 
+# Depth cost of turning from the direction of each row to the direction of each column.
+ANGLE_COSTS = np.array([[v2_angle(a, b) for b in DIRECTION_VECTORS] for a in DIRECTION_VECTORS])
+
+def attack_offset_costs(delta, facing):
+    '''
+    Computes the attack cost of axial offsets from attacking pieces in one batch.
+    The attack search charges 1 plus the turn from the piece's facing for each step,
+    whatever the path, so the cheapest way to an offset only uses the two step
+    directions on either side of it. The cost of an offset is then the smallest
+    a * cost(u) + b * cost(w) over the adjacent direction pairs (u, w) with
+    offset = a * u + b * w, a, b >= 0.
+    :param delta: nx2 array of axial offsets from the attacking pieces.
+    :param facing: direction code of the attacking piece, or an array of n codes.
+    :return: array of n costs.
+    '''
+    offsets = hx.cube_to_axial(DIRECTION_VECTORS)
+    step_costs = 1 + ANGLE_COSTS[facing]
+    u = offsets
+    w = np.roll(offsets, -1, axis = 0)
+    det = u[:, 0] * w[:, 1] - u[:, 1] * w[:, 0]
+
+    delta = np.asarray(delta)[..., None, :]
+    a = (delta[..., 0] * w[:, 1] - delta[..., 1] * w[:, 0]) // det
+    b = (delta[..., 1] * u[:, 0] - delta[..., 0] * u[:, 1]) // det
+
+    costs = a * step_costs + b * np.roll(step_costs, -1, axis = -1)
+    return np.where((a >= 0) & (b >= 0), costs, np.iinfo(np.int64).max).min(axis = -1)
+
+def attack_costs(axial_coords, center, facing, attack_d):
+    '''
+    Computes the attack cost of every tile at once, with attack_offset_costs.
+    :param axial_coords: nx2 array of axial coordinates to compute costs for.
+    :param center: axial coordinates of the attacking piece.
+    :param facing: direction code of the attacking piece.
+    :param attack_d: attack distance of the attacking piece.
+    :return: mask of the attackable tiles, and the cost of every tile.
+    '''
+    costs = attack_offset_costs(np.asarray(axial_coords) - center, facing)
+    return costs <= attack_d, costs
+
 class GameHex(hx.HexTile):
     '''
     Class that holds information about a hexagon
     at specific axial coordinates. Holds information
-    on its coordinates and what piece is on the tile.
+    on its coordinates, and reads what piece is on
+    the tile from the board's PieceStore.
     '''
-    def __init__ (self, axial_coordinates, piece = 0, player = 0, piece_template = EmptyTemplate):
+    def __init__ (self, axial_coordinates, index, pieces):
         self.axial_coordinates = axial_coordinates
-        self.piece = Piece(piece, player, piece_template)
+        self.index = index
+        self.pieces = pieces
+
+    @property
+    def piece(self):
+        slot = self.pieces.tile_slots[self.index]
+        if slot == EMPTY:
+            return EmptyPiece
+        return PieceView(self.pieces, slot)
+
+    @piece.setter
+    def piece(self, piece):
+        self.pieces.place(self.index, piece)
 
     def get_axial_coords(self):
         return self.axial_coordinates
@@ -53,8 +112,8 @@ class GameHex(hx.HexTile):
     def get_piece(self):
         return self.piece
 
-    def set_piece(self, piece, player, piece_template):
-        self.piece = Piece(piece, player, piece_template)
+    def set_piece(self, piece, player, piece_template, direction = "SE"):
+        self.piece = Piece(piece, player, direction, piece_template)
 
 class GameBoard(hx.HexMap):
     '''
@@ -63,310 +122,693 @@ class GameBoard(hx.HexMap):
     other areas of the board, see what available
     moves they have, and attack other players' pieces.
     '''
-    def __init__ (self, file_name):
+    def __init__ (self, file_name, vectorized_attacks = False, log = True, rng = None, roll_buffer = 0,
+                  cache_dir = CACHE_DIR):
 
         self.player = 1
+        self.vectorized_attacks = vectorized_attacks
+
+        # Damage rolls come from rng, a numpy Generator or a seed. Without one,
+        # numpy's global generator is used.
+        self.rolls = DamageRolls(rng, roll_buffer)
+        self.last_roll = None
         self.templates = [EmptyTemplate]
-        self.moved_pieces = []
-        self.fired_pieces = []
-        self.player1_pieces = 0
-        self.player2_pieces = 0
+        self.moved_pieces = set()
+        self.fired_pieces = set()
+
+        # Entries recorded by apply, for undo.
+        self.undo_stack = []
 
         if (not path.exists('settings/default_settings.yaml')):
             print("This program cannot run if default_settings.yaml is missing.")
             raise SystemExit
 
         try:
-            file = open(file_name)
-            test_list = yaml.safe_load(file)
+            scenario = load_scenario(file_name, cache_dir)
+            self.file_name = file_name
         except:
             if file_name == ():
                 print("No file selected, defaulting to default_settings.yaml...")
             else:
                 print("The selected file is in an invalid format, using default_settings.yaml...")
             try:
-                file = open('settings/default_settings.yaml')
-                test_list = yaml.safe_load(file)
+                scenario = load_scenario('settings/default_settings.yaml', cache_dir)
+                self.file_name = 'settings/default_settings.yaml'
             except:
                 print("This program cannot run if default_settings.yaml is missing or is in an invalid format.")
                 raise SystemExit
 
         # Create piece templates
-        for piece, info in test_list['pieces'].items():
-            self.templates.append(PieceTemplate(info['health'], 
-                                                info['movement_d'], 
-                                                info['attack_d'],
-                                                info['power']))
+        for health, movement_d, attack_d, power in scenario.templates[1:].tolist():
+            self.templates.append(PieceTemplate(health, movement_d, attack_d, power))
 
         # Import board from settings
-        self.axial_coords = np.array([np.array(i) for i in test_list['board']])
-
-        self.game_hexes = []
-
-        for a in self.axial_coords:
-            self.game_hexes.append(GameHex(a))
-
-        self.game_hexes = np.array(self.game_hexes)
-
-        # Set player 1 pieces on the board.
-        for piece, piece_info in test_list['player1'].items():
-            index = 0
-            self.player1_pieces += 1
-            for a in self.axial_coords:
-                if np.array_equal(piece_info[1], a):
-                    self.game_hexes[index].piece = Piece(p_type = piece_info[0],
-                                                    player = 1,
-                                                    direction = piece_info[2],
-                                                    template = self.templates[piece_info[0]])
-                index += 1
-
-        # Set player 2 pieces on the board.
-        for piece, piece_info in test_list['player2'].items():
-            index = 0
-            self.player2_pieces += 1
-            for a in self.axial_coords:
-                if np.array_equal(piece_info[1], a):
-                    self.game_hexes[index].piece = Piece(p_type = piece_info[0],
-                                                    player = 2,
-                                                    direction = piece_info[2],
-                                                    template = self.templates[piece_info[0]])
-                index += 1
-
-        self[self.axial_coords] = self.game_hexes
-
-        self.export_loc = export.init_log(self)
-        export.parse_turn(self, self.export_loc)
+        self.axial_coords = np.asarray(scenario.axial_coords)
+
+        self.pieces = PieceStore(self.templates,
+                                 len(self.axial_coords),
+                                 len(scenario.placements))
+
+        # The GameHex of every tile, and the hexy map from coordinates to them,
+        # are only used by the interface, so they are made the first time they
+        # are needed. Headless games never make them.
+        self.hexes = None
+        self.map_filled = False
+
+        self.neighbors = np.asarray(scenario.neighbors)
+        self.search_buffers = SearchBuffers(len(self.axial_coords),
+                                            max(template.attack_d for template in self.templates),
+                                            ANGLE_COSTS.max())
+
+        # Moves and attacks already searched, shared by the interface, the
+        # AI and the checks in move_piece and attack_piece.
+        self.reach_cache = ReachabilityCache()
+
+        # Index the board by coordinates as sorted packed keys, for boards too sparse for the grid below.
+        keys = pack_coords(self.axial_coords)
+        self.key_order = np.argsort(keys)
+        self.sorted_keys = keys[self.key_order]
+
+        # Grid over the rectangle of axial coordinates around the board, holding
+        # the tile index of each coordinate, or -1 where there is no tile.
+        # Sparse boards, whose rectangle is much bigger than the board, use the
+        # sorted keys instead.
+        self.grid_index = None
+        if len(self.axial_coords):
+            self.grid_origin = self.axial_coords.min(axis = 0).astype(np.int64)
+            shape = self.axial_coords.max(axis = 0) - self.grid_origin + 1
+            if shape[0] * shape[1] <= 16 * len(self.axial_coords):
+                self.grid_index = np.full(shape, -1, dtype = np.int64)
+                offsets = self.axial_coords - self.grid_origin
+                self.grid_index[offsets[:, 0], offsets[:, 1]] = np.arange(len(self.axial_coords))
+
+        # Set every player's pieces on the board. Pieces placed off the board are left out.
+        for owner, template, index, facing in scenario.placements.tolist():
+            if index != -1:
+                self.pieces.add(index, owner, template, facing)
+        self.n_players = max(2, int(scenario.placements[:, 0].max(initial = 0)))
+
+        # Zobrist keys of the position. The piece store keeps the hash of the
+        # pieces up to date however they are changed, and hash adds the player
+        # to move. AI policies can use it as the key of a zobrist.TranspositionTable.
+        self.zobrist = ZobristKeys(self.n_players, self.pieces.template_stats[:, 0])
+        self.pieces.use_keys(self.zobrist)
+
+        # Logging can be turned off for simulations that run many games. log is
+        # True for a new file in the logs folder, or an export.LogWriter.
+        self.log = export.LogWriter.to_file() if log is True else (log or None)
+        self.export_loc = None
+        if self.log is not None:
+            self.export_loc = self.log.location
+            self.log.write_header(self)
+            self.log.write_turn(self)
+
+    def snapshot(self):
+        '''
+        Saves the state of the game: the pieces, the current player, and
+        the pieces that have moved or fired this turn. This is a few small
+        array copies, so it is much cheaper than copying the board.
+        :return: the saved state, for restore.
+        '''
+        return self.player, set(self.moved_pieces), set(self.fired_pieces), self.pieces.snapshot()
+
+    def restore(self, snapshot):
+        '''
+        Puts the game back to a state saved by snapshot.
+        '''
+        player, moved_pieces, fired_pieces, pieces = snapshot
+        self.player = player
+        self.moved_pieces = set(moved_pieces)
+        self.fired_pieces = set(fired_pieces)
+        self.pieces.restore(pieces)
+
+    @property
+    def game_hexes(self):
+        '''
+        :return: array of the GameHex of every tile, in tile index order.
+        '''
+        if self.hexes is None:
+            self.hexes = np.empty(len(self.axial_coords), dtype = object)
+            self.hexes[:] = [GameHex(coords, index, self.pieces) for index, coords in enumerate(self.axial_coords)]
+        return self.hexes
+
+    def hex_at(self, index):
+        '''
+        :return: the GameHex of a tile, without making the GameHex of every tile.
+        '''
+        if self.hexes is not None:
+            return self.hexes[index]
+        return GameHex(self.axial_coords[index], index, self.pieces)
+
+    def fill_map(self):
+        '''
+        Fills the hexy map from coordinates to GameHexes the first time it is read.
+        '''
+        if not self.map_filled:
+            self.map_filled = True
+            dict.update(self, zip(make_key_from_coordinates(self.axial_coords), self.game_hexes))
+
+    def __getitem__(self, coordinates):
+        self.fill_map()
+        return super().__getitem__(coordinates)
+
+    def __iter__(self):
+        self.fill_map()
+        return super().__iter__()
+
+    def __len__(self):
+        self.fill_map()
+        return super().__len__()
+
+    def __contains__(self, key):
+        self.fill_map()
+        return super().__contains__(key)
+
+    def keys(self):
+        self.fill_map()
+        return super().keys()
+
+    def values(self):
+        self.fill_map()
+        return super().values()
+
+    def items(self):
+        self.fill_map()
+        return super().items()
+
+    @property
+    def hash(self):
+        '''
+        :return: the Zobrist hash of the position: the pieces and the player to move.
+        '''
+        return self.pieces.hash ^ self.zobrist.side(self.player)
+
+    def compute_hash(self):
+        '''
+        :return: the Zobrist hash of the position worked out from scratch,
+                 which is always the same as hash.
+        '''
+        return self.zobrist.board(self.pieces, self.player)
+
+    def pieces_of(self, player):
+        '''
+        :return: sorted array of the tile indices of a player's pieces.
+        '''
+        return np.array(sorted(self.pieces.player_tiles(player)), dtype = np.int64)
+
+    @property
+    def player1_pieces(self):
+        return len(self.pieces.player_tiles(1))
+
+    @property
+    def player2_pieces(self):
+        return len(self.pieces.player_tiles(2))
+
+    def index_of(self, coords):
+        '''
+        Finds the tile index of a pair of axial coordinates.
+        :param coords: axial coordinates of the tile.
+        :return: the index of the tile, or -1 if it is not on the board.
+        '''
+        if self.grid_index is not None:
+            q = int(coords[0]) - self.grid_origin[0]
+            r = int(coords[1]) - self.grid_origin[1]
+            if 0 <= q < self.grid_index.shape[0] and 0 <= r < self.grid_index.shape[1]:
+                return int(self.grid_index[q, r])
+            return -1
+        return int(self.indices_of(np.array([coords]))[0])
+
+    def indices_of(self, coords):
+        '''
+        Finds the tile indices of an array of axial coordinates.
+        :param coords: nx2 array of axial coordinates.
+        :return: array of tile indices, with -1 for coordinates not on the board.
+        '''
+        if self.grid_index is not None:
+            offsets = np.asarray(coords, dtype = np.int64).reshape(-1, 2) - self.grid_origin
+            inside = np.all((offsets >= 0) & (offsets < self.grid_index.shape), axis = 1)
+            found = np.full(len(offsets), -1, dtype = np.int64)
+            found[inside] = self.grid_index[offsets[inside, 0], offsets[inside, 1]]
+            return found
+
+        keys = pack_coords(coords)
+        found = np.searchsorted(self.sorted_keys, keys)
+        found[found == len(self.sorted_keys)] = 0
+        return np.where(self.sorted_keys[found] == keys, self.key_order[found], -1)
 
     def attack_piece(self, attacker, target):
-        # Check to make sure the coordinates are not the same.
-        if (np.array_equal(attacker, target) 
-        or any(np.array_equal(cd, attacker) for cd in self.fired_pieces) 
-        or any(np.array_equal(cd, target) for cd in self.fired_pieces)):
-            return
+        return self.attack_piece_index(self.index_of(attacker), self.index_of(target))
+
+    def attack_piece_index(self, attacker_index, target_index):
+        '''
+        Same as attack_piece, with the attacker and target given as tile indices.
+        :return: True if the attack was made.
+        '''
+        # Check to make sure the coordinates are on the board and are not the same.
+        if (attacker_index == -1 or target_index == -1
+        or attacker_index == target_index
+        or attacker_index in self.fired_pieces
+        or target_index in self.fired_pieces):
+            return False
         
         # Get the old piece, and create a new piece with 
-        attacking_piece = self[attacker][0]
-        target_piece = self[target][0]
+        attacking_piece = self.hex_at(attacker_index)
+        target_piece = self.hex_at(target_index)
 
         # Check if the piece to attack is owned by the current player
         if attacking_piece.piece.player != self.player:
-            return
+            return False
 
         # Check if the piece's target is owned by the opponent
         elif attacking_piece.piece.player == target_piece.piece.player or target_piece.piece.player == 0:
-            return
+            return False
 
-        valid_moves = self.get_valid_attacks(attacking_piece)
-        valid_moves_axials = np.array([i[0:2] for i in valid_moves])
         # Check if the new coordinate is in the range of valid moves
-        valid_selection = False
-
-        for move in valid_moves_axials:
-            if np.array_equal(target, move):
-                valid_selection = True
+        target = self.axial_coords[target_index]
+        valid_moves = self.get_valid_attacks(attacking_piece)
+        selected = np.flatnonzero((valid_moves[:, 0] == target[0]) & (valid_moves[:, 1] == target[1]))
 
-        if not valid_selection:
-            return
+        if len(selected) == 0:
+            return False
 
         # Check if the piece is the enemy piece. This works
         # because we already checked if the piece at target,
         # is owned by the same player. If the piece at target is
         # not empty as well, then it has to be the enemy's.
         if target_piece.piece.player != 0:
-            index = 0
-            for move in valid_moves_axials:
-                if np.array_equal(move, target):
-                    break
-                index += 1
-
             # Subtract health from the enemy piece.
             # Damage = max attack power divided by 1 plus the natural log of the moves's distance.
             # This is then multiplied by a random value, and then floored to preserve integer value.
-            damage = np.floor(attacking_piece.piece.power / (1 + np.log(valid_moves[index][2])) * max(0, np.random.normal(1, 0.2)))
+            damage = np.floor(attacking_piece.piece.power / (1 + np.log(valid_moves[selected[0]][2])) * max(0, self.next_roll()))
             target_piece.piece.health -= int(damage)
             if target_piece.piece.health > 0:
-                self.fired_pieces.append(attacker)
-                return
+                self.fired_pieces.add(attacker_index)
+                return True
             
         # Place the piece at the old coordinates to the new coordinates, and
         # change the piece at the old coordinates to the empty piece.
 
-        if target_piece.piece.player == 1:
-            self.player1_pieces -= 1
-        elif target_piece.piece.player == 2:
-            self.player2_pieces -= 1
-
-        self[target][0].piece = EmptyPiece
-        self.fired_pieces.append(attacker)
+        self.pieces.remove(self.pieces.tile_slots[target_index])
+        self.fired_pieces.add(attacker_index)
+        return True
     
+    def next_roll(self):
+        '''
+        :return: the next damage multiplier, which is kept as last_roll.
+        '''
+        self.last_roll = self.rolls.next()
+        return self.last_roll
+
+    def apply(self, action):
+        '''
+        Plays one action, and records what it changed on the undo stack.
+        :param action: (MOVE, piece tile, new tile, direction code),
+                       (ATTACK, attacker tile, target tile) or (END_TURN,).
+        :return: what move_piece_index, attack_piece_index or end_turn returned.
+        '''
+        kind = action[0]
+        pieces = self.pieces
+        if kind == MOVE:
+            old_index, new_index, new_facing = action[1:4]
+            slot = int(pieces.tile_slots[old_index]) if old_index != -1 else EMPTY
+            entry = (MOVE, slot, old_index, new_index,
+                     int(pieces.facing[slot]) if slot != EMPTY else 0,
+                     new_index in self.moved_pieces,
+                     old_index in self.fired_pieces,
+                     new_index in self.fired_pieces)
+            result = self.move_piece_index(old_index, new_index, new_facing)
+        elif kind == ATTACK:
+            attacker_index, target_index = action[1:3]
+            slot = int(pieces.tile_slots[target_index]) if target_index != -1 else EMPTY
+            health = int(pieces.health[slot]) if slot != EMPTY else 0
+            had_fired = attacker_index in self.fired_pieces
+            self.last_roll = None
+            result = self.attack_piece_index(attacker_index, target_index)
+            entry = (ATTACK, slot, attacker_index, target_index, health, had_fired, self.last_roll)
+        elif kind == END_TURN:
+            # end_turn replaces the sets rather than changing them, so they can be kept as they are.
+            entry = (END_TURN, self.player, self.moved_pieces, self.fired_pieces)
+            result = self.end_turn()
+        else:
+            raise ValueError("Unknown action: " + str(kind))
+
+        self.undo_stack.append(entry)
+        return result
+
+    def undo(self):
+        '''
+        Takes back the last action played by apply. The damage roll of an
+        undone attack is handed back to the rolls, so playing the attack
+        again rolls the same damage. Turns already written to the log
+        stay in the log.
+        '''
+        entry = self.undo_stack.pop()
+        kind = entry[0]
+        pieces = self.pieces
+        if kind == MOVE:
+            kind, slot, old_index, new_index, facing, had_moved, old_fired, new_fired = entry
+            if slot != EMPTY:
+                if pieces.tile[slot] != old_index:
+                    pieces.move(slot, old_index)
+                pieces.set_facing(slot, facing)
+            if not had_moved:
+                self.moved_pieces.discard(new_index)
+            for index, fired in ((old_index, old_fired), (new_index, new_fired)):
+                if fired:
+                    self.fired_pieces.add(index)
+                else:
+                    self.fired_pieces.discard(index)
+        elif kind == ATTACK:
+            kind, slot, attacker_index, target_index, health, had_fired, roll = entry
+            if slot != EMPTY:
+                if pieces.tile[slot] == EMPTY:
+                    pieces.put(slot, target_index)
+                pieces.set_health(slot, health)
+            if not had_fired:
+                self.fired_pieces.discard(attacker_index)
+            if roll is not None:
+                self.rolls.put_back(roll)
+        else:
+            kind, self.player, self.moved_pieces, self.fired_pieces = entry
+
     def move_piece(self, old_coords, new_coords, new_direction):
+        return self.move_piece_index(self.index_of(old_coords), self.index_of(new_coords), DIRECTION_CODES[new_direction])
+
+    def move_piece_index(self, old_index, new_index, new_facing):
+        '''
+        Same as move_piece, with the tiles given as tile indices
+        and the new direction given as a direction code.
+        :return: True if the piece was moved or turned.
+        '''
+        if old_index == -1 or new_index == -1:
+            return False
 
         # Check to make sure the coordinates are not the same.
-        if (np.array_equal(old_coords, new_coords) 
-        or any(np.array_equal(cd, old_coords) for cd in self.moved_pieces) 
-        or any(np.array_equal(cd, new_coords) for cd in self.moved_pieces)):
-            self[old_coords][0].piece.direction = new_direction
-            self.moved_pieces.append(new_coords)
+        if (old_index == new_index
+        or old_index in self.moved_pieces
+        or new_index in self.moved_pieces):
+            slot = self.pieces.tile_slots[old_index]
+            if slot != EMPTY:
+                self.pieces.set_facing(slot, new_facing)
+            self.moved_pieces.add(new_index)
             
-            return
+            return True
         
         # Get the piece at the old coordinates and the new coordinates
-        old_piece = self[old_coords][0]
-        original_piece_at_new = self[new_coords][0]
+        old_piece = self.hex_at(old_index)
+        original_piece_at_new = self.hex_at(new_index)
 
         # Check if the piece to be moved is owned by the current player
         if old_piece.piece.player != self.player:
-            return
+            return False
 
         # Check if the piece's new location already has a different piece on it.
         if original_piece_at_new.piece.player != 0:
-            return
-
-        valid_moves = self.get_valid_moves(old_piece)
-        valid_moves_axials = np.array([i[0:2] for i in valid_moves])
+            return False
 
         # Check if the new coordinate is in the range of valid moves
-        valid_selection = False
+        states, costs = self.reachable_moves(old_index,
+                                             DIRECTION_CODES[old_piece.piece.direction],
+                                             old_piece.piece.movement_d)
 
-        for move in valid_moves_axials:
-            if np.array_equal(new_coords, move):
-                valid_selection = True
+        if not np.any(states // 6 == new_index):
+            return False
 
-        if not valid_selection:
-            return
+        slot = self.pieces.tile_slots[old_index]
+        self.pieces.move(slot, new_index)
+        self.pieces.set_facing(slot, new_facing)
 
-        self[new_coords][0].piece = self[old_coords][0].piece
-        self[new_coords][0].piece.direction = new_direction
-        self[old_coords][0].piece = EmptyPiece
+        self.moved_pieces.add(new_index)
 
-        self.moved_pieces.append(new_coords)
+        # Since we are saving the tiles of pieces, we need to check if the piece
+        # has already fired, and move that record to its new tile.
+        if old_index in self.fired_pieces:
+            self.fired_pieces.remove(old_index)
+            self.fired_pieces.add(new_index)
 
-        # Since we are saving the coordinates of pieces, we need to check if there
-        # are any fired coordinates at the old coordinates that need to be moved
-        # to the new coordinates
-        index = 0
-        for piece in self.fired_pieces:
-            if np.array_equal(piece, old_coords):
-                self.fired_pieces[index] = new_coords
-                break
-            index += 1
+        return True
 
-    # Directional breadth first search movement algorithm. Absolutely atrocious runtime.
+    # Shortest path search over (tile, facing) states. Turning costs come from
+    # ANGLE_COSTS, and stepping forward onto a free neighbor costs 1. All costs are
+    # small integers, so the frontier is a ring of buckets, one per cost (Dial's
+    # algorithm), and every state is expanded at most once.
     def get_valid_moves(self, hex):
-        dist = hex.piece.movement_d
-        center = hex.get_axial_coords()
-
-        moves = []
-        frontier = Queue()
-
-        Directions = np.array(["NW", "NE", "SE", "SW", "E", "W"])
-
-        move = np.array([center[0], center[1], 0, hex.piece.direction], dtype = object)
-        frontier.put(move)
+        states, costs = self.reachable_moves(hex.index,
+                                             DIRECTION_CODES[hex.piece.direction],
+                                             hex.piece.movement_d)
+
+        index, facing = np.divmod(states, 6)
+        moves = np.empty((len(states), 4), dtype=object)
+        moves[:, 0:2] = self.axial_coords[index]
+        moves[:, 2] = costs
+        moves[:, 3] = DIRECTIONS[facing]
+        return moves
 
-        while not frontier.empty():
-            current = frontier.get()
+    def reachable_moves(self, start_index, start_facing, dist):
+        '''
+        Same as search_moves on the board's own occupancy, with the result
+        kept in reach_cache until one of the tiles the search read changes.
+        The arrays returned are shared with the cache, and must not be changed.
+        :return: the reachable states, as tile index * 6 + direction code, and their costs.
+        '''
+        key = (int(start_index), int(start_facing), int(dist))
+        cached = self.reach_cache.get_moves(self.pieces, key)
+        if cached is not None:
+            return cached
+
+        states, costs = self.search_moves(start_index, start_facing, dist)
+
+        # The search reads the tile in front of every state it can still step forward from.
+        index, facing = np.divmod(states[costs < dist], 6)
+        tiles = np.unique(self.neighbors[index, facing])
+        self.reach_cache.store_moves(self.pieces, key, states, costs, tiles[tiles != -1])
+        return states, costs
+
+    def search_moves(self, start_index, start_facing, dist, occupied = None):
+        '''
+        Runs the movement search from a tile and facing.
+        :param start_index: tile index of the piece.
+        :param start_facing: direction code of the piece.
+        :param dist: movement distance of the piece.
+        :param occupied: optional sequence of whether each tile has a piece on it.
+                         When it is not given, the piece store's occupancy is used.
+        :return: the reachable states, as tile index * 6 + direction code, and their costs.
+        '''
+        angle_costs = ANGLE_COSTS.tolist()
+        neighbors = self.neighbors
+        if occupied is None:
+            occupied = self.pieces.occupancy
+
+        buffers = self.search_buffers
+        buffers.ensure_states()
+        search_id = buffers.next_search()
+        stamp = buffers.state_stamp
+        best = buffers.state_cost
+        results = buffers.move_results
+        result_costs = buffers.move_costs
+        buckets = buffers.buckets
+        n_buckets = len(buckets)
+        for bucket in buckets:
+            bucket.clear()
+
+        start = start_index * 6 + start_facing
+        stamp[start] = search_id
+        best[start] = 0
+        buckets[0].append(start)
+        count = 0
+
+        for cost in range(dist + 1):
+            bucket = buckets[cost % n_buckets]
+            while bucket:
+                state = bucket.popleft()
+
+                # Skip entries that were improved after being added to this bucket.
+                if best[state] < cost:
+                    continue
 
-            r = current[0]
-            q = current[1]
-            cost = current[2]
-            direction = current[3]
+                results[count] = state
+                result_costs[count] = cost
+                count += 1
 
-            found = False
-            for i in moves[::-1]:
-                if np.array_equal(current[0:2], i[0:2]) and current[3] == i[3]:
-                    if current[2] < i[2]:
-                        del i
-                    else:
-                        found = True
-                        break
+                index, facing = divmod(state, 6)
+                for direction, turn_cost in enumerate(angle_costs[facing]):
+                    new_cost = cost + turn_cost
+                    new_state = index * 6 + direction
+                    if new_cost <= dist and (stamp[new_state] != search_id or new_cost < best[new_state]):
+                        stamp[new_state] = search_id
+                        best[new_state] = new_cost
+                        buckets[new_cost % n_buckets].append(new_state)
 
-            if found:
-                continue
+                if cost + 1 > dist:
+                    continue
 
-            for dir in Directions:
-                move_cost = cost + v2_angle(eval(direction), eval(dir))
-                if move_cost <= dist:
-                    move = np.array([r, q, move_cost, dir], dtype = object)
-                    moves.append(move)
+                neighbor = int(neighbors[index, facing])
+                if neighbor == -1 or occupied[neighbor]:
+                    continue
 
-                    cube_current = hx.axial_to_cube(np.array([current[0:2]]))
-                    neighbor = (cube_current + eval(dir))[0]
+                new_state = neighbor * 6 + facing
+                if stamp[new_state] != search_id or cost + 1 < best[new_state]:
+                    stamp[new_state] = search_id
+                    best[new_state] = cost + 1
+                    buckets[(cost + 1) % n_buckets].append(new_state)
+
+        return np.array(results[:count], dtype = np.int64), np.array(result_costs[:count], dtype = np.int64)
+
+    def free_neighbors(self, tiles = None):
+        '''
+        Checks the six neighbors of many tiles at once, by combining the
+        on-board neighbor table with the occupancy mask.
+        :param tiles: optional array of tile indices, all tiles by default.
+        :return: (tiles x 6) bool array of whether each neighbor, in
+                 direction code order, is on the board and empty.
+        '''
+        neighbors = self.neighbors if tiles is None else self.neighbors[tiles]
+        return (neighbors != -1) & ~self.pieces.occupied_mask()[neighbors]
 
-                    if move_cost + 1 <= dist:
-                        neighbor_move = np.array([neighbor[0], neighbor[2], move_cost + 1, dir], dtype = object)
+    def get_valid_attacks(self, hex):
+        # The vectorized range leaves out tiles off the board, so the two are kept apart.
+        key = (hex.index, DIRECTION_CODES[hex.piece.direction], hex.piece.attack_d, self.vectorized_attacks)
+        attacks = self.reach_cache.get_attacks(key)
+        if attacks is None:
+            if self.vectorized_attacks:
+                attacks = self.get_valid_attacks_vectorized(hex)
+            else:
+                attacks = self.get_valid_attacks_bfs(hex)
+            self.reach_cache.store_attacks(key, attacks)
+        return attacks
 
-                        if (np.array_equal(self[neighbor_move[0:2]], []) or self[neighbor_move[0:2]][0].piece.player != 0):
-                            continue
-                        frontier.put(neighbor_move)
+    # Closed form of get_valid_attacks_bfs over the whole board in one batch. Only tiles
+    # on the board are returned, in board order, but their costs match the search.
+    def get_valid_attacks_vectorized(self, hex):
+        in_range, costs = attack_costs(self.axial_coords,
+                                       hex.get_axial_coords(),
+                                       DIRECTION_CODES[hex.piece.direction],
+                                       hex.piece.attack_d)
 
-        moves = np.array(moves, dtype=object)
-        return moves
+        return np.column_stack([self.axial_coords[in_range], costs[in_range]])
 
     # Breadth first search, but technically implemented incorrectly for directional movement. 
     # However, the shapes formed look quite nice to me as an attack formation.
-    def get_valid_attacks(self, hex):
-        center = hex.get_axial_coords()
-        center_direction = eval(hex.piece.direction)
-        center_start = np.array([center[0], center[1], 0])
-        moves = np.array([center_start])
-        
-        frontier = Queue()
-        frontier.put(center_start)
-
-        Directions = np.array(["NW", "NE", "SE", "SW", "E", "W"])
-
-        while not frontier.empty():
-            current = frontier.get()
-
-            if current[2] > hex.piece.attack_d:
-                continue
-
-            cube_current = hx.axial_to_cube(np.array([current[0:2]]))
-            neighbors = np.array([hx.get_neighbor(cube_current, hx.NW),
-                                hx.get_neighbor(cube_current, hx.NE),
-                                hx.get_neighbor(cube_current, hx.SE),
-                                hx.get_neighbor(cube_current, hx.SW),
-                                hx.get_neighbor(cube_current, hx.E),
-                                hx.get_neighbor(cube_current, hx.W)
-                                ])
-
-            index = 0
-            for next_nb in neighbors:
-                direction_cube = eval("hx." + Directions[index])
-                index += 1
-                found = False
-                
-                for i in moves[::-1]:
-                    if np.array_equal(next_nb[0][::2], i[0:2]):
-                        found = True
-                        break
-
-                if found:
+    def get_valid_attacks_bfs(self, hex):
+        return self.search_attacks(hex.get_axial_coords(),
+                                   DIRECTION_CODES[hex.piece.direction],
+                                   hex.piece.attack_d)
+
+    def search_attacks(self, center, facing, dist):
+        '''
+        Runs the attack search from a tile and facing.
+        :param center: axial coordinates of the piece.
+        :param facing: direction code of the piece.
+        :param dist: attack distance of the piece.
+        :return: rows of axial coordinates and cost, in the order they were found.
+        '''
+        center_direction = DIRECTION_VECTORS[facing]
+
+        # The attack search does not stop at the edge of the board, so instead of the
+        # neighbor table it walks indices into a square window of axial offsets around
+        # the piece. Every step costs at least 1, so no tile in range leaves the window.
+        width = 2 * dist + 1
+        offsets = hx.cube_to_axial(ATTACK_VECTORS)
+        steps = (offsets[:, 0] * width + offsets[:, 1]).tolist()
+        step_costs = [1 + v2_angle(center_direction, direction) for direction in ATTACK_VECTORS]
+
+        buffers = self.search_buffers
+        buffers.ensure_window(dist)
+        search_id = buffers.next_search()
+        visited = buffers.window_stamp
+        tiles = buffers.attack_tiles
+        costs = buffers.attack_costs
+
+        # Tiles are added to the frontier in the order they are found,
+        # so the frontier buffer is also the list of attackable tiles.
+        origin = dist * width + dist
+        visited[origin] = search_id
+        tiles[0] = origin
+        costs[0] = 0
+        head = 0
+        tail = 1
+
+        while head < tail:
+            current = tiles[head]
+            cost = costs[head]
+            head += 1
+
+            for step, step_cost in zip(steps, step_costs):
+                new_cost = cost + step_cost
+                if new_cost > dist:
                     continue
-                else:
-                    if current[2] + 1 + v2_angle(center_direction, direction_cube) <= hex.piece.attack_d:
-                        new_move = np.array([next_nb[0][0], next_nb[0][2], current[2] + 1 + v2_angle(center_direction, direction_cube)])
-                        moves = np.vstack([moves, new_move])
-                        frontier.put(new_move)
 
-        return moves
+                next_nb = current + step
+                if visited[next_nb] == search_id:
+                    continue
+
+                visited[next_nb] = search_id
+                tiles[tail] = next_nb
+                costs[tail] = new_cost
+                tail += 1
+
+        found = np.array(tiles[:tail])
+        return np.column_stack([found // width - dist + center[0],
+                                found % width - dist + center[1],
+                                costs[:tail]])
+
+    def get_player_ranges(self, player):
+        '''
+        Finds the moves and attacks of every piece a player owns in one call.
+        Pieces are identified by the index of the tile they are on. The board's
+        occupancy is read once for all pieces, and the attack range of each
+        (facing, attack distance) pair is searched once and shifted to every
+        piece that shares it.
+        :param player: the player whose pieces are searched.
+        :return: an array of (piece, tile index, cost, direction code) rows for the moves,
+                 and an array of (piece, tile index, cost) rows for the attacks on the board.
+        '''
+        pieces = sorted(self.pieces.player_tiles(player))
+
+        moves = []
+        attacks = []
+        attack_ranges = {}
+
+        for piece in pieces:
+            current = self.hex_at(piece).piece
+            facing = DIRECTION_CODES[current.direction]
+
+            states, costs = self.reachable_moves(piece, facing, current.movement_d)
+            tiles, directions = np.divmod(states, 6)
+            moves.append(np.column_stack([np.full(len(states), piece), tiles, costs, directions]))
+
+            if (facing, current.attack_d) not in attack_ranges:
+                attack_ranges[facing, current.attack_d] = self.search_attacks(np.zeros(2, dtype = np.int64),
+                                                                              facing,
+                                                                              current.attack_d)
+            attack_range = attack_ranges[facing, current.attack_d]
+
+            targets = self.indices_of(attack_range[:, 0:2] + self.axial_coords[piece])
+            on_board = targets != -1
+            attacks.append(np.column_stack([np.full(on_board.sum(), piece),
+                                            targets[on_board],
+                                            attack_range[on_board, 2]]))
+
+        moves = np.concatenate(moves).astype(np.int32) if moves else np.empty((0, 4), dtype = np.int32)
+        attacks = np.concatenate(attacks).astype(np.int32) if attacks else np.empty((0, 3), dtype = np.int32)
+        return moves, attacks
 
     # Resets temporary variables, changes the current player, and checks to see 
     # if the game has ended.
     def end_turn(self):
-        export.parse_turn(self, self.export_loc)
-        self.moved_pieces = []
-        self.fired_pieces = []
-
-        if self.player == 1:
-            self.player = 2
-        elif self.player == 2:
-            self.player = 1
-
-        if self.player1_pieces == 0:
-            return 2
-        elif self.player2_pieces == 0:
-            return 1
-        else:
-            return 0
\ No newline at end of file
+        if self.log is not None:
+            self.log.write_turn(self)
+        self.moved_pieces = set()
+        self.fired_pieces = set()
+
+        self.player = self.player % self.n_players + 1
+
+        # The game is won when only one player has pieces left.
+        winner = 0
+        players_left = self.pieces.players_left()
+        if len(players_left) == 1:
+            winner = players_left[0]
+
+        if winner and self.log is not None:
+            self.log.flush()
+        return winner
\ No newline at end of file
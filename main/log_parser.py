@@ -0,0 +1,82 @@
+import numpy as np
+
+from piece import DIRECTION_CODES
+
+# One row per piece in a turn of a log.
+PIECE = np.dtype([("owner", "i4"), ("template", "i4"), ("q", "i4"), ("r", "i4"), ("facing", "i1"), ("health", "i4")])
+
+def parse_piece(fields):
+    '''
+    :return: the (owner, template, q, r, facing, health) tuple of a
+             piece line split into fields, or None if it is not one.
+    '''
+    if len(fields) != 6 or fields[4] not in DIRECTION_CODES:
+        return None
+    try:
+        return (int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]),
+                DIRECTION_CODES[fields[4]], int(fields[5]))
+    except ValueError:
+        return None
+
+def parse_numbers(fields, count):
+    '''
+    :return: the fields as a list of count ints, or None if they are not.
+    '''
+    if len(fields) != count:
+        return None
+    try:
+        return [int(field) for field in fields]
+    except ValueError:
+        return None
+
+class LogParser:
+    '''
+    Reads a text log written by export.py one line at a time.
+    The templates and board tiles are read when the parser is
+    made, and iterating over it yields the pieces on the board
+    after each turn, so a whole log is never held in memory.
+    Comment lines starting with "#", and other lines that do
+    not fit their section, are skipped.
+    '''
+    def __init__(self, location):
+        self.location = location
+        self.file = open(location)
+
+        templates, ignore = self.read_section(lambda fields: parse_numbers(fields, 4))
+        tiles, ignore = self.read_section(lambda fields: parse_numbers(fields, 2))
+
+        # Row 0 is the empty template, so template numbers index the rows.
+        self.templates = np.array([[0, 0, 0, 0]] + templates, dtype = np.int32)
+        self.axial_coords = np.array(tiles, dtype = np.int32).reshape(-1, 2)
+
+    def read_section(self, parse):
+        '''
+        Reads lines up to the next "-" line, or to the end of the file.
+        :return: list of the lines that parse accepted, as parsed, and
+                 whether the section was ended by a "-" line.
+        '''
+        rows = []
+        for line in self.file:
+            if line.strip() == "-":
+                return rows, True
+            if line.startswith("#"):
+                continue
+            row = parse(line.split())
+            if row is not None:
+                rows.append(row)
+        return rows, False
+
+    def __iter__(self):
+        '''
+        :return: generator of PIECE arrays, one per turn, starting
+                 with the board before the first turn.
+        '''
+        with self.file:
+            ended = True
+            while ended:
+                rows, ended = self.read_section(parse_piece)
+                if rows or ended:
+                    yield np.array(rows, dtype = PIECE)
+
+    def close(self):
+        self.file.close()
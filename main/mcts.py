@@ -0,0 +1,208 @@
+import math
+from multiprocessing import Pool, current_process
+
+import numpy as np
+
+from game_board import GameBoard
+from policies import random_policy, greedy_policy, focus_fire_policy
+from rolls import DamageRolls
+from simulation import play_turn
+from zobrist import TranspositionTable
+
+class Node:
+    '''
+    A position in the search tree, reached by one player playing
+    a whole turn. The position is kept as a GameBoard snapshot.
+    '''
+    __slots__ = ('state', 'turn', 'mover', 'winner', 'children', 'untried', 'visits', 'value')
+
+    def __init__(self, state, turn = None, mover = 0, winner = 0):
+        self.state = state
+        self.turn = turn
+        self.mover = mover
+        self.winner = winner
+        self.children = []
+        self.untried = None
+        self.visits = 0
+
+        # Total reward of the rollouts through this node, for the mover.
+        self.value = 0.0
+
+class MCTS:
+    '''
+    Monte Carlo tree search over whole turns. A turn has one action
+    for every piece, far too many to branch on one at a time, so the
+    children of a position are candidate turns made by the scripted
+    policies: the greedy and focus-fire turns and a few random ones.
+    Positions are restored into one board from snapshots, so no
+    board is ever copied. Damage rolls are sampled once, when a
+    child is first expanded. The candidate turns of a position are
+    kept in a transposition table under the board's Zobrist hash,
+    so a position reached again by another line of play does not
+    run the policies again.
+
+    The board is only used for the search, and is put back to
+    the root position when the search is done. Damage during the
+    search is rolled from the search's own rng, so the game's
+    damage rolls are the same whether or not it searched.
+    '''
+    def __init__(self, board, root_state = None, candidates = 6, rollout_turns = 12,
+                 rollout_policy = greedy_policy, exploration = 1.4, rng = None, table = None):
+        self.board = board
+        self.root = Node(board.snapshot() if root_state is None else root_state)
+        self.candidates = candidates
+        self.rollout_turns = rollout_turns
+        self.rollout_policy = rollout_policy
+        self.exploration = exploration
+        self.rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+        self.table = TranspositionTable() if table is None else table
+
+    def candidate_turns(self, player):
+        '''
+        :return: list of distinct turns for the player to move on the board.
+        '''
+        cached = self.table.get(self.board.hash)
+        if cached is not None:
+            return list(cached)
+
+        turns = [greedy_policy(self.board, player, self.rng), focus_fire_policy(self.board, player, self.rng)]
+        while len(turns) < self.candidates:
+            turns.append(random_policy(self.board, player, self.rng))
+
+        unique = {}
+        for turn in turns:
+            unique.setdefault(tuple(turn), turn)
+        turns = list(unique.values())
+        self.table.store(self.board.hash, turns)
+        return list(turns)
+
+    def rewards(self, winner):
+        '''
+        :return: array of the reward of each player for the board's position:
+                 1 for the winner and -1 for the others, or the player's share
+                 of the health left on the board, scaled to between -1 and 1.
+        '''
+        rewards = np.zeros(self.board.n_players + 1)
+        if winner:
+            rewards[1:] = -1
+            rewards[winner] = 1
+            return rewards
+
+        pieces = self.board.pieces
+        alive = pieces.alive()
+        health = np.bincount(pieces.owner[alive], weights = pieces.health[alive], minlength = len(rewards))
+        total = max(health.sum(), 1)
+        return (2 * health - total) / total
+
+    def select(self, node):
+        log_visits = math.log(max(node.visits, 1))
+        return max(node.children,
+                   key = lambda child: child.value / child.visits
+                   + self.exploration * math.sqrt(log_visits / child.visits))
+
+    def search(self, iterations):
+        '''
+        Runs the search.
+        :return: the turn of the most visited child of the root.
+        '''
+        board = self.board
+
+        # Turns played during the search are not part of the game, so they are not
+        # logged, and their damage is not taken from the game's rolls.
+        log, board.log = board.log, None
+        rolls, board.rolls = board.rolls, DamageRolls(self.rng)
+        last_roll = board.last_roll
+        for iteration in range(iterations):
+            node = self.root
+            path = [node]
+            while node.winner == 0 and node.untried == [] and node.children:
+                node = self.select(node)
+                path.append(node)
+
+            board.restore(node.state)
+            winner = node.winner
+            if winner == 0:
+                if node.untried is None:
+                    node.untried = self.candidate_turns(board.player)
+                if node.untried:
+                    turn = node.untried.pop()
+                    mover = board.player
+                    winner = play_turn(board, turn)
+                    child = Node(board.snapshot(), turn, mover, winner)
+                    node.children.append(child)
+                    path.append(child)
+
+            for rollout_turn in range(self.rollout_turns):
+                if winner:
+                    break
+                winner = play_turn(board, self.rollout_policy(board, board.player, self.rng))
+
+            rewards = self.rewards(winner)
+            for visited in path:
+                visited.visits += 1
+                visited.value += rewards[visited.mover]
+
+        board.restore(self.root.state)
+        board.log = log
+        board.rolls = rolls
+        board.last_roll = last_roll
+        if not self.root.children:
+            return []
+        return max(self.root.children, key = lambda child: child.visits).turn
+
+def search_worker(args):
+    '''
+    Runs one tree search from a snapshot on a board of its own.
+    :param args: tuple of settings file, snapshot, iterations,
+                 MCTS keyword arguments, and a numpy SeedSequence.
+    :return: list of (turn, visits) for the children of the root.
+    '''
+    file_name, state, iterations, settings, seed = args
+    board = GameBoard(file_name, log = False, rng = np.random.default_rng(seed))
+    tree = MCTS(board, state, rng = np.random.default_rng(seed.spawn(1)[0]), **settings)
+    tree.search(iterations)
+    return [(child.turn, child.visits) for child in tree.root.children]
+
+def parallel_search(board, iterations, workers = None, seed = 0, **settings):
+    '''
+    Root-parallel search: independent trees are searched from the same
+    position across a pool of processes, each for the given number of
+    iterations, and the visit counts of their root turns are added up.
+    It starts a Pool, so it cannot be called from inside a pool worker,
+    as daemonic processes are not allowed to have children.
+    :return: the turn with the most visits over all the trees.
+    '''
+    workers = workers or 1
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    jobs = [(board.file_name, board.snapshot(), iterations, settings, worker_seed) for worker_seed in seeds]
+
+    with Pool(workers) as pool:
+        results = pool.map(search_worker, jobs)
+
+    visits = {}
+    turns = {}
+    for children in results:
+        for turn, count in children:
+            visits[tuple(turn)] = visits.get(tuple(turn), 0) + count
+            turns[tuple(turn)] = turn
+    if not visits:
+        return []
+    return turns[max(visits, key = visits.get)]
+
+class MCTSPlayer:
+    '''
+    Policy that picks each turn by tree search, searching on the
+    game's own board, or across a pool of processes when workers
+    is more than 1. It can be used wherever the policies in
+    policies.py are. When it is run inside a pool worker, as in
+    monte_carlo.run_games, it searches in that process instead.
+    '''
+    def __init__(self, iterations = 200, workers = 1, **settings):
+        self.iterations = iterations
+        self.workers = workers
+        self.settings = settings
+
+    def __call__(self, board, player, rng):
+        if self.workers > 1 and not current_process().daemon:
+            return parallel_search(board, self.iterations, self.workers, int(rng.integers(2 ** 32)), **self.settings)
+        return MCTS(board, rng = rng, **self.settings).search(self.iterations)
@@ -0,0 +1,83 @@
+import argparse
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from simulation import Simulation
+from policies import random_policy, POLICIES
+
+def play_game(args):
+    '''
+    Plays one game to the end, or until max_turns turns have passed.
+    :param args: tuple of settings file, policy, max turns, and a
+                 numpy SeedSequence for the game's random numbers.
+    :return: the winner (0 for no winner), the number of turns played,
+             and the total health left for each player.
+    '''
+    file_name, policy, max_turns, seed = args
+    # Policy choices and damage rolls get separate streams. They are built from the
+    # seed's key rather than seed.spawn, which would give new streams on every call.
+    policy_seed, damage_seed = [np.random.SeedSequence(seed.entropy, spawn_key = seed.spawn_key + (stream,))
+                                for stream in (0, 1)]
+    rng = np.random.default_rng(policy_seed)
+
+    simulation = Simulation(file_name, max_turns = max_turns,
+                            rng = np.random.default_rng(damage_seed), roll_buffer = 256)
+    while not simulation.done:
+        simulation.step(policy(simulation.board, simulation.player, rng))
+
+    pieces = simulation.board.pieces
+    alive = pieces.alive()
+    health = np.bincount(pieces.owner[alive], weights = pieces.health[alive],
+                         minlength = simulation.board.n_players + 1)[1:]
+    return (simulation.winner, simulation.turn - 1) + tuple(int(player_health) for player_health in health)
+
+def run_games(file_name, policy = random_policy, games = 100, workers = None, seed = 0, max_turns = 200):
+    '''
+    Plays independent games across a pool of processes. Every game
+    gets its own seed from seed, so the results do not depend on
+    how the games are split between the workers.
+    :return: array of (winner, turns, player 1 health, player 2 health, ...) rows,
+             one per game, with the health left for every player in the scenario.
+    '''
+    seeds = np.random.SeedSequence(seed).spawn(games)
+    jobs = [(file_name, policy, max_turns, game_seed) for game_seed in seeds]
+
+    with Pool(workers) as pool:
+        results = pool.map(play_game, jobs, chunksize = max(1, games // (4 * (workers or os.cpu_count() or 1))))
+
+    if not results:
+        return np.empty((0, 4), dtype = np.int64)
+    return np.array(results, dtype = np.int64)
+
+def summarize(results):
+    '''
+    Aggregates the results of run_games.
+    :return: dictionary of win rates, turn counts and surviving health.
+    '''
+    winners, turns = results[:, 0], results[:, 1]
+    players = range(1, results.shape[1] - 1)
+    summary = {"games": len(results)}
+    for player in players:
+        summary["player {} win rate".format(player)] = float(np.mean(winners == player))
+    summary["no winner rate"] = float(np.mean(winners == 0))
+    summary["mean turns"] = float(np.mean(turns))
+    summary["std turns"] = float(np.std(turns))
+    for player in players:
+        summary["mean player {} health left".format(player)] = float(np.mean(results[:, player + 1]))
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Play many games in parallel and report win rates.")
+    parser.add_argument("settings", nargs = "?", default = "settings/default_settings.yaml")
+    parser.add_argument("--games", type = int, default = 100)
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--max-turns", type = int, default = 200)
+    parser.add_argument("--policy", choices = sorted(POLICIES), default = "random")
+    args = parser.parse_args()
+
+    results = run_games(args.settings, POLICIES[args.policy], args.games, args.workers, args.seed, args.max_turns)
+    for name, value in summarize(results).items():
+        print("{:<28} {}".format(name, value))
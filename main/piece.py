@@ -1,5 +1,15 @@
+import numpy as np
 import hexy as hx
 
+# Directions in the order they turn around a hexagon. A piece's
+# facing code is the index of its direction in this array.
+DIRECTIONS = np.array(["SE", "SW", "W", "NW", "NE", "E"])
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+
+# Sentinel for an empty tile in PieceStore.tile_slots, and for
+# a piece that has been taken off the board in PieceStore.tile.
+EMPTY = -1
+
 class PieceTemplate(hx.HexTile):
     '''
     Interntal class to hold basic information
@@ -17,9 +27,12 @@ EmptyTemplate = PieceTemplate(0, 0, 0, 0)
 class Piece:
     '''
     Holds information about a piece on the board.
-    Stores coordinates, piece type, owner, and 
+    Stores coordinates, piece type, owner, and
     the PlayerTemplate it is based on.
     '''
+    __slots__ = ('p_type', 'player', 'max_health', 'health', 'movement_d',
+                 'attack_d', 'power', 'direction', 'template')
+
     def __init__ (self, p_type, player, direction, template = EmptyTemplate):
         self.p_type = p_type
         self.player = player
@@ -31,4 +44,334 @@ class Piece:
         self.direction = direction
         self.template = template
 
-EmptyPiece = Piece(0, 0, "", EmptyTemplate)
+class EmptyTilePiece(Piece):
+    '''
+    Placeholder piece reported for empty tiles. Boards record
+    empty tiles in their PieceStore, so this is read only, and
+    sharing it between tiles cannot leak changes from one
+    tile to another.
+    '''
+    __slots__ = ()
+
+    def __init__(self):
+        for name, value in (('p_type', 0), ('player', 0), ('max_health', 0), ('health', 0),
+                            ('movement_d', 0), ('attack_d', 0), ('power', 0), ('direction', ""),
+                            ('template', EmptyTemplate)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("An empty tile has no piece to change.")
+
+EmptyPiece = EmptyTilePiece()
+
+class PieceStore:
+    '''
+    Stores every piece on a board as parallel arrays, one
+    entry (slot) per piece: its owner, template number,
+    health, facing code, and the index of the tile it is
+    on. Pieces that have been removed from the board keep
+    their slot, with a tile index of EMPTY.
+    '''
+    def __init__(self, templates, n_tiles, capacity = 0):
+        self.templates = templates
+
+        # Columns are health, movement_d, attack_d and power.
+        self.template_stats = np.array([[t.health, t.movement_d, t.attack_d, t.power] for t in templates],
+                                       dtype = np.int32)
+
+        self.count = 0
+        self.owner = np.zeros(capacity, dtype = np.int32)
+        self.template = np.zeros(capacity, dtype = np.int32)
+        self.health = np.zeros(capacity, dtype = np.int32)
+        self.facing = np.zeros(capacity, dtype = np.int8)
+        self.tile = np.full(capacity, EMPTY, dtype = np.int32)
+
+        # Slot of the piece on each tile, or EMPTY for empty tiles.
+        self.tile_slots = np.full(n_tiles, EMPTY, dtype = np.int32)
+
+        # Tiles of the pieces each player has on the board.
+        self.owner_tiles = {}
+
+        # One byte per tile, 1 if it has a piece on it. Indexing a bytearray is
+        # much faster than indexing a NumPy array from Python code like the
+        # movement search, and occupied_mask views the same bytes as an array.
+        self.occupancy = bytearray(n_tiles)
+
+        # Occupancy version, counting the changes to the occupancy, and the
+        # version at which each tile's occupancy last changed. Cached searches
+        # compare them to tell whether a tile they read has changed since.
+        self.version = 0
+        self.tile_versions = np.zeros(n_tiles, dtype = np.int64)
+
+        # Zobrist hash of the pieces on the board, kept up to date by every
+        # method that changes them once use_keys has been given the keys.
+        self.zobrist = None
+        self.hash = 0
+
+    def use_keys(self, zobrist):
+        '''
+        Starts keeping the hash of the pieces, with the keys of a zobrist.ZobristKeys.
+        '''
+        self.zobrist = zobrist
+        self.hash = zobrist.pieces(self)
+
+    def key(self, slot):
+        '''
+        :return: the Zobrist key of the piece in a slot, or 0 when
+                 there are no keys or the piece is not on the board.
+        '''
+        if self.zobrist is None or self.tile[slot] == EMPTY:
+            return 0
+        return self.zobrist.piece(int(self.tile[slot]), int(self.owner[slot]), int(self.template[slot]),
+                                  int(self.facing[slot]), int(self.health[slot]))
+
+    def changed(self, tiles):
+        '''
+        Records that the occupancy of some tiles has changed.
+        :param tiles: tile index or array of tile indices.
+        '''
+        self.version += 1
+        self.tile_versions[tiles] = self.version
+
+    def add(self, tile, owner, template, facing, health = None):
+        '''
+        Places a new piece on an empty tile.
+        :return: the slot of the new piece.
+        '''
+        if self.count == len(self.owner):
+            capacity = max(1, 2 * self.count)
+            self.owner = np.resize(self.owner, capacity)
+            self.template = np.resize(self.template, capacity)
+            self.health = np.resize(self.health, capacity)
+            self.facing = np.resize(self.facing, capacity)
+            self.tile = np.resize(self.tile, capacity)
+
+        slot = self.count
+        self.count += 1
+
+        self.owner[slot] = owner
+        self.template[slot] = template
+        self.health[slot] = self.template_stats[template, 0] if health is None else health
+        self.facing[slot] = facing
+        self.tile[slot] = tile
+        self.tile_slots[tile] = slot
+        self.occupancy[tile] = 1
+        self.changed(tile)
+        self.owner_tiles.setdefault(int(owner), set()).add(int(tile))
+        self.hash ^= self.key(slot)
+        return slot
+
+    def set_health(self, slot, health):
+        self.hash ^= self.key(slot)
+        self.health[slot] = health
+        self.hash ^= self.key(slot)
+
+    def set_facing(self, slot, facing):
+        self.hash ^= self.key(slot)
+        self.facing[slot] = facing
+        self.hash ^= self.key(slot)
+
+    def move(self, slot, tile):
+        '''
+        Moves a piece to an empty tile.
+        '''
+        self.hash ^= self.key(slot)
+        tiles = self.owner_tiles[int(self.owner[slot])]
+        tiles.discard(int(self.tile[slot]))
+        tiles.add(int(tile))
+        self.occupancy[self.tile[slot]] = 0
+        self.occupancy[tile] = 1
+        self.changed([self.tile[slot], tile])
+
+        self.tile_slots[self.tile[slot]] = EMPTY
+        self.tile_slots[tile] = slot
+        self.tile[slot] = tile
+        self.hash ^= self.key(slot)
+
+    def remove(self, slot):
+        '''
+        Takes a piece off the board.
+        '''
+        self.hash ^= self.key(slot)
+        self.owner_tiles[int(self.owner[slot])].discard(int(self.tile[slot]))
+        self.occupancy[self.tile[slot]] = 0
+        self.changed(self.tile[slot])
+        self.tile_slots[self.tile[slot]] = EMPTY
+        self.tile[slot] = EMPTY
+
+    def put(self, slot, tile):
+        '''
+        Puts a piece that was taken off the board back on an empty tile.
+        '''
+        self.tile_slots[tile] = slot
+        self.tile[slot] = tile
+        self.occupancy[tile] = 1
+        self.changed(tile)
+        self.owner_tiles.setdefault(int(self.owner[slot]), set()).add(int(tile))
+        self.hash ^= self.key(slot)
+
+    def remove_dead(self):
+        '''
+        Takes every piece with no health left off the board at once.
+        :return: the slots of the removed pieces.
+        '''
+        dead = np.flatnonzero((self.tile[:self.count] != EMPTY) & (self.health[:self.count] <= 0))
+        for slot in dead.tolist():
+            self.hash ^= self.key(slot)
+        for owner, tile in zip(self.owner[dead].tolist(), self.tile[dead].tolist()):
+            self.owner_tiles[owner].discard(tile)
+            self.occupancy[tile] = 0
+        if len(dead):
+            self.changed(self.tile[dead])
+        self.tile_slots[self.tile[dead]] = EMPTY
+        self.tile[dead] = EMPTY
+        return dead
+
+    def place(self, tile, piece):
+        '''
+        Puts a Piece or PieceView on a tile, replacing whatever was
+        on it. Placing an empty piece clears the tile.
+        '''
+        if self.tile_slots[tile] != EMPTY:
+            self.remove(self.tile_slots[tile])
+
+        if piece.player == 0:
+            return
+
+        if isinstance(piece, PieceView) and piece.store is self:
+            if self.tile[piece.slot] != EMPTY:
+                self.remove(piece.slot)
+            self.tile_slots[tile] = piece.slot
+            self.tile[piece.slot] = tile
+            self.occupancy[tile] = 1
+            self.changed(tile)
+            self.owner_tiles.setdefault(piece.player, set()).add(int(tile))
+            self.hash ^= self.key(piece.slot)
+        else:
+            self.add(tile, piece.player, piece.p_type, DIRECTION_CODES[piece.direction], piece.health)
+
+    def alive(self):
+        '''
+        :return: the slots of every piece on the board, in slot order.
+        '''
+        return np.flatnonzero(self.tile[:self.count] != EMPTY)
+
+    def snapshot(self):
+        '''
+        :return: a copy of the pieces and their positions, for restore.
+        '''
+        count = self.count
+        return (count,
+                self.owner[:count].copy(),
+                self.template[:count].copy(),
+                self.health[:count].copy(),
+                self.facing[:count].copy(),
+                self.tile[:count].copy(),
+                self.tile_slots.copy(),
+                bytes(self.occupancy),
+                {owner: set(tiles) for owner, tiles in self.owner_tiles.items()},
+                self.hash)
+
+    def restore(self, snapshot):
+        '''
+        Puts back the pieces saved by snapshot. The snapshot is copied,
+        so it can be restored again. The tile arrays are updated in place,
+        so views such as occupied_mask stay valid. Tiles whose occupancy
+        is different in the snapshot are recorded as changed.
+        '''
+        count, owner, template, health, facing, tile, tile_slots, occupancy, owner_tiles, self.hash = snapshot
+        self.count = count
+        self.owner = owner.copy()
+        self.template = template.copy()
+        self.health = health.copy()
+        self.facing = facing.copy()
+        self.tile = tile.copy()
+        self.tile_slots[:] = tile_slots
+        differ = np.flatnonzero(self.occupied_mask() != np.frombuffer(occupancy, dtype = np.bool_))
+        if len(differ):
+            self.changed(differ)
+        self.occupancy[:] = occupancy
+        self.owner_tiles = {owner: set(tiles) for owner, tiles in owner_tiles.items()}
+
+    def occupied_mask(self):
+        '''
+        :return: bool array of whether each tile has a piece on it. It is a
+                 view of the store's occupancy, so it stays up to date.
+        '''
+        return np.frombuffer(self.occupancy, dtype = np.bool_)
+
+    def player_tiles(self, player):
+        '''
+        :return: the set of tiles of the pieces a player has on the board.
+                 The set is kept up to date by the store, and must not be changed.
+        '''
+        return self.owner_tiles.get(player, set())
+
+    def players_left(self):
+        '''
+        :return: the sorted list of players with pieces on the board.
+        '''
+        return sorted(owner for owner, tiles in self.owner_tiles.items() if tiles)
+
+    def ordered_slots(self):
+        '''
+        :return: the slots of every piece on the board, ordered by
+                 owner and then by tile, as the logs list them.
+        '''
+        slots = [self.tile_slots[sorted(self.owner_tiles[owner])] for owner in sorted(self.owner_tiles)]
+        return np.concatenate(slots) if slots else np.empty(0, dtype = np.int32)
+
+class PieceView:
+    '''
+    Attribute access to one piece in a PieceStore, so
+    code written against Piece keeps working.
+    '''
+    __slots__ = ('store', 'slot')
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    @property
+    def p_type(self):
+        return int(self.store.template[self.slot])
+
+    @property
+    def player(self):
+        return int(self.store.owner[self.slot])
+
+    @property
+    def template(self):
+        return self.store.templates[self.p_type]
+
+    @property
+    def max_health(self):
+        return int(self.store.template_stats[self.p_type, 0])
+
+    @property
+    def health(self):
+        return int(self.store.health[self.slot])
+
+    @health.setter
+    def health(self, health):
+        self.store.set_health(self.slot, health)
+
+    @property
+    def movement_d(self):
+        return int(self.store.template_stats[self.p_type, 1])
+
+    @property
+    def attack_d(self):
+        return int(self.store.template_stats[self.p_type, 2])
+
+    @property
+    def power(self):
+        return int(self.store.template_stats[self.p_type, 3])
+
+    @property
+    def direction(self):
+        return str(DIRECTIONS[self.store.facing[self.slot]])
+
+    @direction.setter
+    def direction(self, direction):
+        self.store.set_facing(self.slot, DIRECTION_CODES[direction])
@@ -0,0 +1,144 @@
+import numpy as np
+
+from game_board import attack_offset_costs
+from simulation import MOVE, ATTACK
+
+def legal_actions(board, player):
+    '''
+    Finds every move and attack a player can make this turn, with one
+    search per piece from get_player_ranges. Pieces that have already
+    moved or fired this turn are left out, and attacks are only kept
+    when there is an enemy piece on the target tile.
+    :param board: the GameBoard being played.
+    :param player: the player to find actions for.
+    :return: an array of (piece, tile index, cost, direction code) rows for the moves,
+             and an array of (attacker, target, cost) rows for the attacks.
+    '''
+    moves, attacks = board.get_player_ranges(player)
+    occupancy = board.pieces.occupied_mask()
+    owners = board.pieces.owner[board.pieces.tile_slots[attacks[:, 1]]]
+
+    attacks = attacks[occupancy[attacks[:, 1]] & (owners != player)]
+    if board.fired_pieces:
+        attacks = attacks[~np.isin(attacks[:, 0], list(board.fired_pieces))]
+    if board.moved_pieces:
+        moves = moves[~np.isin(moves[:, 0], list(board.moved_pieces))]
+    return moves, attacks
+
+def expected_damage(board, attacks):
+    '''
+    :return: the damage each (attacker, target, cost) row does with an average roll.
+    '''
+    power = board.pieces.template_stats[board.pieces.template[board.pieces.tile_slots[attacks[:, 0]]], 3]
+    return np.floor(power / (1 + np.log(np.maximum(attacks[:, 2], 1))))
+
+def enemy_tiles(board, player):
+    return np.array(sorted(tile for owner, tiles in board.pieces.owner_tiles.items()
+                           if owner != player for tile in tiles), dtype = np.int64)
+
+def approach(board, moves, targets):
+    '''
+    Picks one move for every piece, taking each piece to the tile and
+    facing with the cheapest attack on its nearest target, and then
+    the cheapest move. No two pieces are sent to the same tile.
+    :param moves: array of move rows from legal_actions.
+    :param targets: array of the tile indices to move towards.
+    :return: list of MOVE actions.
+    '''
+    if len(moves) == 0 or len(targets) == 0:
+        return []
+
+    # Nearest target of every tile a move ends on, by hex distance.
+    tiles, inverse = np.unique(moves[:, 1], return_inverse = True)
+    delta = board.axial_coords[targets][None, :, :] - board.axial_coords[tiles][:, None, :]
+    distance = (np.abs(delta[:, :, 0]) + np.abs(delta[:, :, 1]) + np.abs(delta[:, :, 0] + delta[:, :, 1])) // 2
+    nearest = delta[np.arange(len(tiles)), distance.argmin(axis = 1)]
+
+    attack_cost = attack_offset_costs(nearest[inverse], moves[:, 3])
+    order = np.lexsort((moves[:, 2], attack_cost, moves[:, 0]))
+
+    actions = []
+    claimed = set()
+    moved = set()
+    for piece, tile, cost, facing in moves[order].tolist():
+        if piece in moved or (tile in claimed and tile != piece):
+            continue
+        moved.add(piece)
+        claimed.add(tile)
+        actions.append((MOVE, piece, tile, facing))
+    return actions
+
+def random_policy(board, player, rng):
+    '''
+    Attacks a random enemy in range with every piece that can, and
+    then moves every piece to a random reachable tile and direction.
+    :param board: the GameBoard being played.
+    :param player: the player to choose actions for.
+    :param rng: numpy Generator to choose with.
+    :return: list of actions for Simulation.step.
+    '''
+    moves, attacks = legal_actions(board, player)
+    actions = []
+
+    for piece in np.unique(attacks[:, 0]):
+        targets = attacks[attacks[:, 0] == piece, 1]
+        actions.append((ATTACK, int(piece), int(rng.choice(targets))))
+
+    for piece in np.unique(moves[:, 0]):
+        options = moves[moves[:, 0] == piece]
+        choice = options[rng.integers(len(options))]
+        actions.append((MOVE, int(piece), int(choice[1]), int(choice[3])))
+
+    return actions
+
+def greedy_policy(board, player, rng):
+    '''
+    Every piece that can attacks the enemy in range it hurts the most,
+    and then every piece moves towards its nearest enemy, facing so
+    that the enemy is as cheap as possible to attack next turn.
+    '''
+    moves, attacks = legal_actions(board, player)
+    actions = []
+
+    if len(attacks):
+        order = np.lexsort((-expected_damage(board, attacks), attacks[:, 0]))
+        attackers, first = np.unique(attacks[order, 0], return_index = True)
+        for attacker, target, cost in attacks[order][first].tolist():
+            actions.append((ATTACK, attacker, target))
+
+    return actions + approach(board, moves, enemy_tiles(board, player))
+
+def focus_fire_policy(board, player, rng):
+    '''
+    Concentrates attacks on the weakest enemies: the enemy in range
+    with the least health is attacked until the expected damage is
+    enough to take it off the board, and then the next weakest. The
+    pieces then move towards the enemy with the least health.
+    '''
+    moves, attacks = legal_actions(board, player)
+    pieces = board.pieces
+    actions = []
+
+    if len(attacks):
+        health = pieces.health[pieces.tile_slots[attacks[:, 1]]]
+        damage = expected_damage(board, attacks)
+        order = np.lexsort((-damage, attacks[:, 1], health))
+
+        used = set()
+        dealt = {}
+        for (attacker, target, cost), hp, hit in zip(attacks[order].tolist(), health[order].tolist(),
+                                                    damage[order].tolist()):
+            if attacker in used or dealt.get(target, 0) >= hp:
+                continue
+            used.add(attacker)
+            dealt[target] = dealt.get(target, 0) + hit
+            actions.append((ATTACK, attacker, target))
+
+    enemies = enemy_tiles(board, player)
+    if len(enemies):
+        weakest = pieces.health[pieces.tile_slots[enemies]]
+        enemies = enemies[weakest == weakest.min()]
+
+    return actions + approach(board, moves, enemies)
+
+POLICIES = {"random": random_policy, "greedy": greedy_policy, "focus-fire": focus_fire_policy}
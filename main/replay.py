@@ -0,0 +1,218 @@
+import numpy as np
+
+import export
+from piece import EMPTY
+
+# A replay file is laid out as:
+#   header:   magic, version, number of templates, number of tiles
+#   the template table, int32 (templates x 4): health, movement_d, attack_d, power
+#   the board, int32 (tiles x 2) of axial coordinates, in tile index order
+#   one block per turn: a uint32 piece count and that many RECORDs
+#   the turn index: uint64 file offset of each turn block
+#   trailer:  offset of the turn index, number of turns, magic
+MAGIC = b"HXRP"
+VERSION = 1
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("n_templates", "<u4"), ("n_tiles", "<u4")])
+TRAILER = np.dtype([("index_offset", "<u8"), ("n_turns", "<u4"), ("magic", "S4")])
+RECORD = np.dtype([("owner", "u1"), ("template", "<u2"), ("tile", "<i4"), ("facing", "i1"), ("health", "<i4")])
+
+# Delta replays have the same layout, with the keyframe interval added to the
+# header and the piece's slot added to each record. Turns that are a multiple
+# of the keyframe interval list every piece on the board, and the turns between
+# them only list the pieces whose tile, facing or health changed. Pieces taken
+# off the board are listed with a tile of EMPTY.
+DELTA_MAGIC = b"HXRD"
+DELTA_HEADER = np.dtype(HEADER.descr + [("keyframe_interval", "<u4")])
+SLOT_RECORD = np.dtype([("slot", "<u4")] + RECORD.descr)
+
+def turn_records(game):
+    '''
+    :return: array of RECORDs for the pieces on the board, ordered by player and then by tile.
+    '''
+    return slot_records(game.pieces, game.pieces.ordered_slots(), RECORD)
+
+def slot_records(pieces, slots, dtype = SLOT_RECORD):
+    '''
+    :return: array of records for the given slots of a PieceStore.
+    '''
+    records = np.empty(len(slots), dtype = dtype)
+    if "slot" in dtype.names:
+        records["slot"] = slots
+    records["owner"] = pieces.owner[slots]
+    records["template"] = pieces.template[slots]
+    records["tile"] = pieces.tile[slots]
+    records["facing"] = pieces.facing[slots]
+    records["health"] = pieces.health[slots]
+    return records
+
+class ReplayWriter:
+    '''
+    Writes a game as a binary replay. It can be used as the log
+    of a GameBoard in place of an export.LogWriter. The turn
+    index is written by close, so a replay has to be closed
+    before it can be read.
+    '''
+    magic = MAGIC
+
+    def __init__(self, handle, flush_interval = 1, location = None):
+        self.handle = handle
+        self.flush_interval = flush_interval
+        self.location = location
+        self.offset = 0
+        self.offsets = []
+
+    @classmethod
+    def to_file(cls, location = None, flush_interval = 1):
+        '''
+        Opens a new replay file, with a timestamped name in the logs folder by default.
+        '''
+        location = location or export.log_location(".replay")
+        return cls(open(location, "xb"), flush_interval = flush_interval, location = location)
+
+    def write(self, data):
+        self.handle.write(data)
+        self.offset += len(data)
+
+    def header(self, game):
+        return np.array([(self.magic, VERSION, len(game.templates), len(game.axial_coords))], dtype = HEADER)
+
+    def write_header(self, game):
+        self.write(self.header(game).tobytes())
+        self.write(game.pieces.template_stats.astype("<i4").tobytes())
+        self.write(game.axial_coords.astype("<i4").tobytes())
+
+    def write_turn(self, game):
+        self.write_block(turn_records(game))
+
+    def write_block(self, records):
+        self.offsets.append(self.offset)
+        self.write(np.uint32(len(records)).tobytes())
+        self.write(records.tobytes())
+        if self.flush_interval and len(self.offsets) % self.flush_interval == 0:
+            self.flush()
+
+    def flush(self):
+        self.handle.flush()
+
+    def close(self):
+        index_offset = self.offset
+        self.write(np.array(self.offsets, dtype = "<u8").tobytes())
+        self.write(np.array([(index_offset, len(self.offsets), self.magic)], dtype = TRAILER).tobytes())
+        self.handle.close()
+
+class DeltaReplayWriter(ReplayWriter):
+    '''
+    Writes a game as a delta replay: a full keyframe every
+    keyframe_interval turns, and only the pieces that changed
+    on the turns in between.
+    '''
+    magic = DELTA_MAGIC
+
+    def __init__(self, handle, keyframe_interval = 50, flush_interval = 1, location = None):
+        super().__init__(handle, flush_interval, location)
+        self.keyframe_interval = keyframe_interval
+        self.tile = np.empty(0, dtype = np.int32)
+        self.facing = np.empty(0, dtype = np.int8)
+        self.health = np.empty(0, dtype = np.int32)
+
+    @classmethod
+    def to_file(cls, location = None, keyframe_interval = 50, flush_interval = 1):
+        '''
+        Opens a new delta replay file, with a timestamped name in the logs folder by default.
+        '''
+        location = location or export.log_location(".replay")
+        return cls(open(location, "xb"), keyframe_interval, flush_interval, location)
+
+    def header(self, game):
+        header = super().header(game)
+        return np.array([tuple(header[0]) + (self.keyframe_interval,)], dtype = DELTA_HEADER)
+
+    def write_turn(self, game):
+        pieces = game.pieces
+        count = pieces.count
+
+        if len(self.offsets) % self.keyframe_interval == 0:
+            slots = pieces.alive()
+        else:
+            # Pieces added since the last turn count as changed.
+            changed = np.ones(count, dtype = bool)
+            seen = len(self.tile)
+            changed[:seen] = ((pieces.tile[:seen] != self.tile)
+                              | (pieces.facing[:seen] != self.facing)
+                              | (pieces.health[:seen] != self.health))
+            slots = np.flatnonzero(changed)
+
+        self.write_block(slot_records(pieces, slots))
+        self.tile = pieces.tile[:count].copy()
+        self.facing = pieces.facing[:count].copy()
+        self.health = pieces.health[:count].copy()
+
+class ReplayReader:
+    '''
+    Reads a binary replay by memory-mapping it, so any turn
+    can be read straight from its offset in the turn index
+    without reading the turns before it.
+    '''
+    magic = MAGIC
+    header_dtype = HEADER
+    record_dtype = RECORD
+
+    def __init__(self, location):
+        self.data = np.memmap(location, dtype = np.uint8, mode = "r")
+
+        header = self.data[:self.header_dtype.itemsize].view(self.header_dtype)[0]
+        trailer = self.data[len(self.data) - TRAILER.itemsize:].view(TRAILER)[0]
+        if header["magic"] != self.magic or trailer["magic"] != self.magic:
+            raise ValueError(str(location) + " is not a complete replay file of this kind.")
+        self.header = header
+
+        offset = self.header_dtype.itemsize
+        self.templates = self.data[offset:offset + 16 * header["n_templates"]].view("<i4").reshape(-1, 4)
+        offset += 16 * int(header["n_templates"])
+        self.axial_coords = self.data[offset:offset + 8 * header["n_tiles"]].view("<i4").reshape(-1, 2)
+
+        index_offset = int(trailer["index_offset"])
+        self.offsets = self.data[index_offset:index_offset + 8 * int(trailer["n_turns"])].view("<u8")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def block(self, n):
+        '''
+        :return: the records stored for turn n.
+        '''
+        offset = int(self.offsets[n])
+        count = int(self.data[offset:offset + 4].view("<u4")[0])
+        return self.data[offset + 4:offset + 4 + count * self.record_dtype.itemsize].view(self.record_dtype)
+
+    def turn(self, n):
+        '''
+        :param n: the turn to read, with 0 for the board before the first turn.
+        :return: array of RECORDs for the pieces on the board after turn n.
+        '''
+        return self.block(n)
+
+class DeltaReplayReader(ReplayReader):
+    '''
+    Reads a delta replay. A turn is rebuilt from the keyframe
+    before it and the changes recorded since that keyframe.
+    '''
+    magic = DELTA_MAGIC
+    header_dtype = DELTA_HEADER
+    record_dtype = SLOT_RECORD
+
+    def turn(self, n):
+        '''
+        :param n: the turn to rebuild, with 0 for the board before the first turn.
+        :return: array of SLOT_RECORDs for the pieces on the board after
+                 turn n, ordered by player and then by tile.
+        '''
+        n = range(len(self))[n]
+        keyframe = n - n % int(self.header["keyframe_interval"])
+        records = np.concatenate([self.block(turn) for turn in range(keyframe, n + 1)])
+
+        # The latest record of each piece is its state after turn n.
+        ignore, latest = np.unique(records["slot"][::-1], return_index = True)
+        records = records[::-1][latest]
+        records = records[records["tile"] != EMPTY]
+        return records[np.lexsort((records["tile"], records["owner"]))]
@@ -0,0 +1,51 @@
+import numpy as np
+
+class DamageRolls:
+    '''
+    Source of the random N(1, 0.2) multipliers used for attack
+    damage. Rolls come from a numpy Generator, so games can be
+    replayed from a seed, or from numpy's global generator
+    when no generator or seed is given.
+
+    With a buffer size, multipliers are drawn from the generator
+    that many at a time and handed out one by one, instead of
+    drawing a single value for every attack.
+    '''
+    def __init__(self, rng = None, buffer_size = 0):
+        if rng is None:
+            self.rng = np.random
+        elif isinstance(rng, (np.random.Generator, np.random.RandomState)):
+            self.rng = rng
+        else:
+            self.rng = np.random.default_rng(rng)
+
+        self.buffer_size = buffer_size
+        self.buffer = np.empty(0)
+        self.position = 0
+
+        # Rolls handed back by put_back, given out again before any new ones.
+        self.returned = []
+
+    def next(self):
+        '''
+        :return: the next damage multiplier.
+        '''
+        if self.returned:
+            return self.returned.pop()
+
+        if not self.buffer_size:
+            return self.rng.normal(1, 0.2)
+
+        if self.position == len(self.buffer):
+            self.buffer = self.rng.normal(1, 0.2, self.buffer_size)
+            self.position = 0
+
+        roll = self.buffer[self.position]
+        self.position += 1
+        return roll
+
+    def put_back(self, roll):
+        '''
+        Hands back a roll, so it is the next one given out.
+        '''
+        self.returned.append(roll)
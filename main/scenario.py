@@ -0,0 +1,142 @@
+import hashlib
+import os
+
+import numpy as np
+import yaml
+
+from board_shapes import board_coords, build_neighbor_table
+from piece import DIRECTION_CODES
+
+# Use libyaml's loader when PyYAML was built with it, as it is much
+# faster than the pure Python one on big boards.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Compiled scenarios are kept here, named by the hash of their settings file.
+CACHE_DIR = "settings/cache"
+
+# A compiled scenario file is a HEADER followed by int32 arrays:
+#   the template table (templates x 4): health, movement_d, attack_d, power
+#   the board (tiles x 2) of axial coordinates
+#   the neighbor table (tiles x 6), as made by board_shapes.build_neighbor_table
+#   the placements (pieces x 4): owner, template, tile index, facing code
+# VERSION changes whenever the compiler does, so older compiled files are compiled again.
+MAGIC = b"HXSC"
+VERSION = 2
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("n_templates", "<u4"),
+                   ("n_tiles", "<u4"), ("n_placements", "<u4")])
+
+def load_settings(file_name):
+    '''
+    Parses a settings file.
+    :return: the settings as a dictionary.
+    '''
+    with open(file_name) as file:
+        return yaml.load(file, Loader = SafeLoader)
+
+def file_hash(file_name):
+    with open(file_name, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+class Scenario:
+    '''
+    The arrays a GameBoard is built from: templates, tile
+    coordinates, neighbor table and starting pieces. Placements
+    of pieces on tiles that are not on the board have a tile
+    index of -1. GameBoard leaves them out, so they do not
+    keep their player in the game.
+    '''
+    def __init__(self, templates, axial_coords, neighbors, placements):
+        self.templates = templates
+        self.axial_coords = axial_coords
+        self.neighbors = neighbors
+        self.placements = placements
+
+    @classmethod
+    def from_settings(cls, settings):
+        '''
+        Compiles a parsed settings file.
+        '''
+        templates = [[0, 0, 0, 0]]
+        for piece, info in settings['pieces'].items():
+            templates.append([info['health'], info['movement_d'], info['attack_d'], info['power']])
+
+        axial_coords = board_coords(settings['board']).astype(np.int32)
+        tile_index = {(q, r): index for index, (q, r) in enumerate(axial_coords.tolist())}
+
+        # Players are listed as player1, player2, player3 and so on.
+        placements = []
+        owner = 1
+        while 'player' + str(owner) in settings:
+            for piece, piece_info in settings['player' + str(owner)].items():
+                placements.append([owner,
+                                   piece_info[0],
+                                   tile_index.get(tuple(piece_info[1]), -1),
+                                   DIRECTION_CODES[piece_info[2]]])
+            owner += 1
+
+        return cls(np.array(templates, dtype = np.int32),
+                   axial_coords,
+                   build_neighbor_table(axial_coords).astype(np.int32),
+                   np.array(placements, dtype = np.int32).reshape(-1, 4))
+
+    def save(self, location):
+        '''
+        Writes the scenario to a file, replacing it in one step
+        so other processes never see a half written file.
+        '''
+        header = np.array([(MAGIC, VERSION, len(self.templates), len(self.axial_coords), len(self.placements))],
+                          dtype = HEADER)
+        partial = location + "." + str(os.getpid())
+        with open(partial, "wb") as file:
+            file.write(header.tobytes())
+            for array in (self.templates, self.axial_coords, self.neighbors, self.placements):
+                file.write(np.ascontiguousarray(array, dtype = "<i4").tobytes())
+        os.replace(partial, location)
+
+    @classmethod
+    def open(cls, location):
+        '''
+        Memory-maps a scenario file written by save.
+        '''
+        header = np.fromfile(location, dtype = HEADER, count = 1)
+        if len(header) == 0 or header[0]["magic"] != MAGIC or header[0]["version"] != VERSION:
+            raise ValueError(str(location) + " is not a compiled scenario.")
+        header = header[0]
+
+        data = np.memmap(location, dtype = "<i4", mode = "r", offset = HEADER.itemsize)
+        arrays = []
+        start = 0
+        for rows, columns in ((header["n_templates"], 4), (header["n_tiles"], 2),
+                              (header["n_tiles"], 6), (header["n_placements"], 4)):
+            end = start + int(rows) * columns
+            arrays.append(data[start:end].reshape(-1, columns))
+            start = end
+        return cls(*arrays)
+
+def load_scenario(file_name, cache_dir = CACHE_DIR):
+    '''
+    Loads a settings file, from its compiled copy in cache_dir if
+    it has one, and otherwise by parsing it and saving the compiled
+    copy, when cache_dir can be written to. Passing None for cache_dir parses the file without caching.
+    :return: the Scenario.
+    '''
+    if cache_dir is None:
+        return Scenario.from_settings(load_settings(file_name))
+
+    location = os.path.join(cache_dir, file_hash(file_name) + ".scenario")
+    if os.path.exists(location):
+        try:
+            return Scenario.open(location)
+        except ValueError:
+            pass
+
+    scenario = Scenario.from_settings(load_settings(file_name))
+
+    # The cache only saves time, so a cache folder that cannot be
+    # written to, as in a read-only checkout, is not an error.
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        scenario.save(location)
+    except OSError:
+        pass
+    return scenario
@@ -0,0 +1,127 @@
+from collections import deque
+
+from zobrist import TranspositionTable
+
+class SearchBuffers:
+    '''
+    Preallocated scratch space for a board's movement and
+    attack searches. Entries are stamped with the number of
+    the search that wrote them, so the buffers never have
+    to be cleared or reallocated between searches. The
+    movement buffers are made by the first movement search,
+    so boards that are never searched do not pay for them.
+    '''
+    def __init__(self, n_tiles, max_attack_d, max_turn_cost = 3):
+        self.n_states = n_tiles * 6
+        self.search_id = 0
+
+        # Movement search, over (tile, facing) states.
+        self.state_stamp = []
+        self.state_cost = []
+        self.move_results = []
+        self.move_costs = []
+
+        # Ring of cost buckets. A state is never pushed more than
+        # max_turn_cost past the cost being expanded.
+        self.buckets = [deque() for _ in range(max_turn_cost + 1)]
+
+        # Attack search, over a window of offsets around the piece.
+        self.window_stamp = []
+        self.attack_tiles = []
+        self.attack_costs = []
+        self.ensure_window(max_attack_d)
+
+    def ensure_states(self):
+        '''
+        Makes the movement buffers, one entry per (tile, facing) state.
+        '''
+        if len(self.state_stamp) < self.n_states:
+            self.state_stamp = [0] * self.n_states
+            self.state_cost = [0] * self.n_states
+            self.move_results = [0] * self.n_states
+            self.move_costs = [0] * self.n_states
+
+    def ensure_window(self, attack_d):
+        '''
+        Grows the attack buffers so they can hold every
+        offset within attack_d of a piece.
+        :param attack_d: attack distance of the piece being searched.
+        '''
+        size = (2 * attack_d + 1) ** 2
+        if size > len(self.window_stamp):
+            self.window_stamp = [0] * size
+            self.attack_tiles = [0] * size
+            self.attack_costs = [0] * size
+
+    def next_search(self):
+        '''
+        Starts a new search, invalidating every entry
+        stamped by the previous ones.
+        '''
+        self.search_id += 1
+        return self.search_id
+
+class ReachabilityCache:
+    '''
+    Results of a board's movement and attack searches, so the same
+    piece is not searched again and again during a turn. Moves are
+    kept under (tile, facing, movement_d) with the occupancy version
+    they were found at and the tiles the search read. An entry is
+    only searched again once one of those tiles has changed since
+    that version, so pieces moving elsewhere on the board leave it
+    valid. Attacks do not depend on the occupancy, so they are kept
+    under (tile, facing, attack_d, vectorized) for good. Both are
+    kept in TranspositionTables of size entries, so the least
+    recently used ranges are dropped on big boards and long runs.
+    hits and misses count the lookups.
+    '''
+    def __init__(self, size = 1 << 14):
+        self.moves = TranspositionTable(size)
+        self.attacks = TranspositionTable(size)
+        self.hits = 0
+        self.misses = 0
+
+    def get_moves(self, pieces, key):
+        '''
+        :param pieces: the board's PieceStore.
+        :param key: (tile, facing, movement_d) of the piece.
+        :return: the cached (states, costs) of the movement search, or None.
+        '''
+        entry = self.moves.get(key)
+        if entry is not None:
+            states, costs, tiles, version = entry
+            if version == pieces.version or pieces.tile_versions[tiles].max(initial = 0) <= version:
+                # Nothing the search read has changed, so the entry holds at the current version.
+                if version != pieces.version:
+                    self.moves.store(key, (states, costs, tiles, pieces.version))
+                self.hits += 1
+                return states, costs
+
+        self.misses += 1
+        return None
+
+    def store_moves(self, pieces, key, states, costs, tiles):
+        '''
+        :param tiles: array of the tiles whose occupancy the search read.
+        '''
+        self.moves.store(key, (states, costs, tiles, pieces.version))
+
+    def get_attacks(self, key):
+        '''
+        :param key: (tile, facing, attack_d) of the piece, and whether
+                    the range is the vectorized one.
+        :return: the cached attack rows, or None.
+        '''
+        attacks = self.attacks.get(key)
+        if attacks is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return attacks
+
+    def store_attacks(self, key, attacks):
+        self.attacks.store(key, attacks)
+
+    def clear(self):
+        self.moves.clear()
+        self.attacks.clear()
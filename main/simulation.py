@@ -0,0 +1,58 @@
+from game_board import GameBoard, MOVE, ATTACK
+
+def play_turn(board, actions):
+    '''
+    Plays one turn for the current player of a board and then ends the turn.
+    Actions the board does not allow are skipped.
+    :param actions: sequence of (MOVE, piece tile, new tile, direction code)
+                    and (ATTACK, attacker tile, target tile) tuples, applied in order.
+    :return: the number of the winning player, or 0 if the game is still going.
+    '''
+    for action in actions:
+        if action[0] == MOVE:
+            board.move_piece_index(action[1], action[2], action[3])
+        elif action[0] == ATTACK:
+            board.attack_piece_index(action[1], action[2])
+        else:
+            raise ValueError("Unknown action: " + str(action[0]))
+
+    return board.end_turn()
+
+class Simulation:
+    '''
+    Runs a game on a GameBoard without a display. Nothing
+    here imports pygame or tkinter, and logging is off by
+    default, so many games can be run on machines with no
+    screen. Tiles are given as tile indices and directions
+    as direction codes, as returned by get_player_ranges.
+    '''
+    def __init__(self, file_name, log = False, vectorized_attacks = False, max_turns = None,
+                 rng = None, roll_buffer = 0):
+        self.board = GameBoard(file_name, vectorized_attacks = vectorized_attacks, log = log,
+                               rng = rng, roll_buffer = roll_buffer)
+        self.max_turns = max_turns
+        self.turn = 1
+        self.winner = 0
+
+    @property
+    def player(self):
+        return self.board.player
+
+    @property
+    def done(self):
+        return self.winner != 0 or (self.max_turns is not None and self.turn > self.max_turns)
+
+    def step(self, actions):
+        '''
+        Plays one turn for the current player and then ends the turn.
+        Actions the board does not allow are skipped.
+        :param actions: sequence of (MOVE, piece tile, new tile, direction code)
+                        and (ATTACK, attacker tile, target tile) tuples, applied in order.
+        :return: the number of the winning player, or 0 if the game is still going.
+        '''
+        if self.done:
+            return self.winner
+
+        self.winner = play_turn(self.board, actions)
+        self.turn += 1
+        return self.winner
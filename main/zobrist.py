@@ -0,0 +1,149 @@
+from collections import OrderedDict
+
+import numpy as np
+
+MASK = (1 << 64) - 1
+
+# Salt that keeps the keys for the player to move apart from the piece keys.
+SIDE_SALT = 0x5DEECE66D
+
+def mix(value):
+    '''
+    The splitmix64 finalizer, used to turn a feature number into a
+    random looking 64 bit key without storing a table of keys.
+    '''
+    z = (value + 0x9E3779B97F4A7C15) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+def mix_array(values):
+    '''
+    Same as mix, for an array of uint64 values.
+    '''
+    with np.errstate(over = "ignore"):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+class ZobristKeys:
+    '''
+    Zobrist keys for a board: one 64 bit key for every (tile, owner,
+    template, facing, health bucket) a piece can have, and one for
+    each player to move. A position's hash is the XOR of the keys
+    of its pieces and of the player to move, so a change to one
+    piece updates the hash with two XORs. Keys are made by mixing
+    the feature numbers rather than kept in a table, as a table
+    would need a key for every tile times every kind of piece.
+    '''
+    def __init__(self, n_players, max_health, buckets = 8, seed = 0):
+        self.n_templates = len(max_health)
+        self.max_health = np.asarray(max_health, dtype = np.int64)
+        self.max_health_list = self.max_health.tolist()
+        self.buckets = buckets
+        self.n_kinds = (n_players + 1) * self.n_templates * 6 * buckets
+        self.seed = (seed & 0xFFFF) << 48
+        self.sides = [mix(self.seed ^ SIDE_SALT ^ (player << 40)) for player in range(n_players + 1)]
+
+    def kinds(self, owner, template, facing, health):
+        '''
+        :return: array of the kind numbers of pieces, given as arrays of their features.
+        '''
+        bucket = np.clip(health * self.buckets // (self.max_health[template] + 1), 0, self.buckets - 1)
+        return ((owner * self.n_templates + template) * 6 + facing) * self.buckets + bucket
+
+    def piece(self, tile, owner, template, facing, health):
+        '''
+        :return: the key of one piece.
+        '''
+        bucket = min(max(health * self.buckets // (self.max_health_list[template] + 1), 0), self.buckets - 1)
+        kind = ((owner * self.n_templates + template) * 6 + facing) * self.buckets + bucket
+        return mix(self.seed ^ (tile * self.n_kinds + kind))
+
+    def side(self, player):
+        '''
+        :return: the key of the player to move.
+        '''
+        return self.sides[player]
+
+    def pieces(self, pieces):
+        '''
+        :return: the hash of every piece on the board of a PieceStore.
+        '''
+        alive = pieces.alive()
+        tiles = pieces.tile[alive].astype(np.int64)
+        kinds = self.kinds(pieces.owner[alive].astype(np.int64),
+                          pieces.template[alive].astype(np.int64),
+                          pieces.facing[alive].astype(np.int64),
+                          pieces.health[alive].astype(np.int64))
+        keys = mix_array(np.uint64(self.seed) ^ (tiles * self.n_kinds + kinds).astype(np.uint64))
+        return int(np.bitwise_xor.reduce(keys, initial = np.uint64(0)))
+
+    def board(self, pieces, player):
+        '''
+        :return: the hash of the pieces of a PieceStore and the player to move.
+        '''
+        return self.pieces(pieces) ^ self.side(player)
+
+class TranspositionTable:
+    '''
+    Bounded table of values found for positions, keyed by their
+    Zobrist hash. With "lru" replacement the least recently used
+    entry is dropped when the table is full. With "depth"
+    replacement every hash has one slot, and an entry is only
+    replaced by one searched at least as deeply. hits and misses
+    count the lookups.
+    '''
+    def __init__(self, size = 1 << 16, replacement = "lru"):
+        if replacement not in ("lru", "depth"):
+            raise ValueError("Unknown replacement: " + str(replacement))
+        self.size = size
+        self.replacement = replacement
+        self.entries = OrderedDict() if replacement == "lru" else [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default = None):
+        '''
+        :return: the value stored for key, or default if there is none.
+        '''
+        if self.replacement == "lru":
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][1]
+        else:
+            entry = self.entries[key % self.size]
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[2]
+
+        self.misses += 1
+        return default
+
+    def store(self, key, value, depth = 0):
+        if self.replacement == "lru":
+            self.entries[key] = (depth, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+        else:
+            slot = key % self.size
+            entry = self.entries[slot]
+            if entry is None or entry[0] == key or depth >= entry[1]:
+                self.entries[slot] = (key, depth, value)
+
+    def clear(self):
+        '''
+        Drops every entry. The hit and miss counts are kept.
+        '''
+        if self.replacement == "lru":
+            self.entries.clear()
+        else:
+            self.entries = [None] * self.size
+
+    def __len__(self):
+        if self.replacement == "lru":
+            return len(self.entries)
+        return sum(entry is not None for entry in self.entries)